@@ -1,5 +1,6 @@
 from .core import Intel, Atheros, Nexmon, AtherosPull10, NexmonPull46
-from .utils import scidx, calib
+from .core import read_many, make_csi_socket
+from .utils import scidx, calib, quantize, dequantize
 
 
 __version__ = "1.3.7"
@@ -1,11 +1,20 @@
 # batch processing of CSI and computer vision data
-import glob
+import concurrent.futures
+import datetime
+import functools
+import json
 import os
+import re
+import struct
+import warnings
 import numpy as np
-import csiread
-import time
 import sys
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:     # Python < 3.8
+    shared_memory = None
+
 
 def main():
     cam_file = "2021.06.10.23.26.44"
@@ -15,21 +24,178 @@ def main():
     cam_dir1 = "./"
     cam_dir = cam_dir1 + cam_file + "/"
 
-    pcap_all = glob.glob(wifi_dir + "*.pcap")
-    pcap_all.sort(key=os.path.getmtime)
+    pcap_all, pcap_ts = list_pcaps(wifi_dir)
 
     pcap_now = wifi_dir + "1623382164609.pcap"
     cam_list = cam_dir + "list.txt"
-    cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all)
+    cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all, pcap_ts, verbose=True)
+
+
+# sidecar file caching the time stamp difference of each pcap in a folder
+SYNC_FILE = ".sync.json"
+
+# assumed duration of the last pcap file
+PCAP_DURATION = np.timedelta64(10, 'm')
+
+# pcap names end with a 13-digit epoch time in ms
+PCAP_NAME = re.compile(r'\d{13}\.pcap$', re.ASCII)
+
+_POW10_13 = 10 ** np.arange(12, -1, -1, dtype=np.int64)
+
+
+def _parse13(chars):
+    """Decode an (N, 13) uint8 array of ASCII digits into N int64 values
+
+    Returns None if any of chars is not a digit.
+    """
+    digits = chars.astype(np.int64) - ord('0')
+    if np.any((digits < 0) | (digits > 9)):
+        return None
+    return digits @ _POW10_13
+
+
+def read_cam_ts(cam_list):
+    """epoch time in ms of each line in cam_list
+
+    Every line of cam_list starts with a 13-digit epoch time in ms. The file
+    is mapped into memory and the digits of all lines are decoded one column
+    at a time, so the memory used stays a few integers per line.
+    """
+    if os.path.getsize(cam_list) == 0:
+        return np.zeros(0, dtype=np.int64)
+    buf = np.memmap(cam_list, dtype=np.uint8, mode='r')
+    starts = np.flatnonzero(buf[:-1] == ord('\n')) + 1
+    starts = np.concatenate(([0], starts))
+    err = "%s: each line must start with a 13-digit epoch time" % cam_list
+    if starts[-1] + 13 > buf.size:
+        raise ValueError(err)
+    ts = np.zeros(starts.size, dtype=np.int64)
+    index = np.empty_like(starts)
+    for k in range(13):
+        np.add(starts, k, out=index)
+        # non-digits wrap around to values above 9
+        digit = buf[index] - np.uint8(ord('0'))
+        if np.any(digit > 9):
+            raise ValueError(err)
+        ts *= 10
+        ts += digit
+    return ts
+
 
+def is_sorted(cam_ts):
+    """whether cam_ts returned by read_cam_ts is in ascending order
 
-def cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all):
+    It is a full pass over cam_ts, do it once per cam_list and pass the
+    result to ``cam_csi_syn`` as ``cam_sorted``.
+    """
+    return bool(np.all(cam_ts[1:] >= cam_ts[:-1]))
+
+
+def _name_ts(pcaps):
+    """epoch time in ms encoded in the names of pcaps"""
+    names = np.array([os.fsencode(p[-18:-5]) for p in pcaps], dtype='S13')
+    ts = _parse13(names.view(np.uint8).reshape(len(pcaps), 13))
+    if ts is None:
+        raise ValueError("pcap file names must end with a 13-digit epoch "
+                         "time and '.pcap'")
+    return ts
+
+
+def list_pcaps(wifi_dir):
+    """pcap files in wifi_dir, sorted by the epoch time in their names
+
+    pcap files whose names do not end with an epoch time are skipped.
+
+    Returns: 1) pcap files
+    2) epoch time in ms of each pcap file, parsed from its name
+    """
+    entries = []
+    with os.scandir(wifi_dir) as it:
+        for e in it:
+            if not e.name.endswith('.pcap') or not e.is_file():
+                continue
+            if PCAP_NAME.search(e.name):
+                entries.append(e)
+            else:
+                warnings.warn("%s: no epoch time in the name, skipped"
+                              % e.path, stacklevel=2)
+    # timestamps are kept in their own int64 column, apart from the paths
+    pcap_ts = _name_ts([e.name for e in entries])
+    order = np.argsort(pcap_ts, kind='stable')
+    return [entries[i].path for i in order], pcap_ts[order]
+
+
+def first_pcap_ts(pcap):
+    """sec and usec of the first nexmon_csi packet in pcap
+
+    Only the record headers are read, the CSI itself is never parsed.
+    """
+    with open(pcap, 'rb') as f:
+        magic = f.read(4)
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = '<'
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = '>'
+        else:
+            raise Exception("Not a pcap capture file (bad magic: %r)" % magic)
+        f.seek(24)
+        while True:
+            header = f.read(16)
+            if len(header) < 16:
+                raise Exception("No nexmon_csi packet in %s" % pcap)
+            sec, usec, caplen = struct.unpack(endian + 'III', header[:12])
+            # the source MAC address of nexmon_csi frames is 'NEXMON'
+            eth = f.read(12)
+            if eth[6:12] == b'NEXMON':
+                return sec, usec
+            f.seek(caplen - len(eth), os.SEEK_CUR)
+
+
+@functools.lru_cache(maxsize=128)
+def _first_ts(pcap, mtime):
+    """``first_pcap_ts`` cached by (pcap, mtime)"""
+    return first_pcap_ts(pcap)
+
+
+def _load_sync(sync_file):
+    """entries of sync_file, malformed ones are dropped as cache misses"""
+    try:
+        with open(sync_file, 'r') as f:
+            sync_cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(sync_cache, dict):
+        return {}
+    return {key: entry for key, entry in sync_cache.items()
+            if isinstance(entry, dict) and 'mtime' in entry
+            and isinstance(entry.get('csi_ts_diff_ms'), int)}
+
+
+def _save_sync(sync_file, sync_cache):
+    # write to a temporary file first so that readers never see half of it
+    tmp_file = "%s.%d" % (sync_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(sync_cache, f)
+    os.replace(tmp_file, sync_file)
+
+
+def cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all, pcap_ts=None,
+                verbose=False, cam_ts=None, sidecar=False, cam_sorted=None):
     """
     Args:
         cam_list: txt file with camera localization results as XY labels
         cam_file: camera file folder name with date and time that contains the cam_list file
         pcap_now: csi pcap file to be sycned
         pcap_all: all pcap files in the folder
+        pcap_ts: sorted epoch time of pcap_all returned by list_pcaps,
+            parsed from the file names if None
+        verbose: print the intermediate time stamps
+        cam_ts: epoch time of cam_list returned by read_cam_ts, read from
+            cam_list if None
+        sidecar: reuse and record the time stamp difference of pcap_now in
+            ``SYNC_FILE`` next to it, as long as pcap_now is not modified
+        cam_sorted: whether cam_ts is in ascending order, see ``is_sorted``,
+            checked here if None
 
     Returns: 1) time stamp difference between server and client
     2) matched camera and csi time stamps on server
@@ -38,66 +204,166 @@ def cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all):
     csi on client (csi), camera time stamp on server (cam)
     """
 
-    # csiread params
-    bandwidth = 20
-    chiptype = "43455c0"
-    pcap_num = len(pcap_all)
+    if pcap_ts is None:
+        pcap_ts = np.sort(_name_ts(pcap_all))
+    pcap_num = len(pcap_ts)
+    pcap_now_ts = int(pcap_now[-18:-5])
+    pcap_now_idx = int(np.searchsorted(pcap_ts, pcap_now_ts))
+    if pcap_now_idx == pcap_num or pcap_ts[pcap_now_idx] != pcap_now_ts:
+        raise ValueError("%s is not in pcap_all" % pcap_now)
 
-    cam_ts = []
-    with open(cam_list, 'r') as cam_reader:
-        for line in cam_reader:
-            cam_ts.append(int(line[0:13]))
+    if cam_ts is None:
+        cam_ts = read_cam_ts(cam_list)
+    if cam_sorted is None:
+        cam_sorted = is_sorted(cam_ts)
 
     # convert linux epoch time to date time
-    pcap_now_linuxtime = int(pcap_now[-18:-5])
-    pcap_now_datetime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(pcap_now_linuxtime/1000.))
-    print("date time:", pcap_now_datetime)
+    pcap_now_linuxtime = pcap_now_ts
+    pcap_now_datetime = datetime.datetime.fromtimestamp(
+        pcap_now_linuxtime/1000.)
+    if verbose:
+        print("date time:", pcap_now_datetime.strftime('%Y-%m-%d %H:%M:%S'))
 
     # see if camera and csi file dates match or not
-    if pcap_now_datetime[0:4] != cam_file[0:4] or pcap_now_datetime[5:7] != cam_file[5:7] or \
-        pcap_now_datetime[8:10] != cam_file[8:10]:
+    pcap_now_date = pcap_now_datetime.date()
+    if (pcap_now_date.year, pcap_now_date.month, pcap_now_date.day) != \
+            (int(cam_file[0:4]), int(cam_file[5:7]), int(cam_file[8:10])):
         sys.exit("file dates do not match")
 
-    # use csiread to find time stamp on client computer
-    csidata = csiread.Nexmon(pcap_now, chip=chiptype, bw=bandwidth)
-    csidata.read()
+    pcap_now_mtime = os.path.getmtime(pcap_now)
+    sync_file = os.path.join(os.path.dirname(pcap_now), SYNC_FILE)
+    sync_key = os.path.basename(pcap_now)
+    sync_cache = _load_sync(sync_file) if sidecar else {}
+    sync_entry = sync_cache.get(sync_key)
+    if sync_entry is not None and sync_entry['mtime'] == pcap_now_mtime:
+        csi_ts_diff = sync_entry['csi_ts_diff_ms']
+    else:
+        # use the first csi packet to find time stamp on client computer
+        csi_sec, csi_usec = _first_ts(pcap_now, pcap_now_mtime)
 
-    # TO verify: csidata.sec + .usec = time stamp
-    csi_client_ts = csidata.sec[0]*1000 + csidata.usec[0]
-    print(csidata.sec, 'sec')
-    print(csi_client_ts, 'mili-sec')
+        # TO verify: csidata.sec + .usec = time stamp
+        csi_client_ts = csi_sec*1000 + csi_usec
+        if verbose:
+            print(csi_sec, 'sec')
+            print(csi_client_ts, 'mili-sec')
 
-    # calculate delta time
-    csi_ts_diff = int(pcap_now_linuxtime) - csi_client_ts
+        # calculate delta time
+        csi_ts_diff = pcap_now_linuxtime - csi_client_ts
+        if sidecar:
+            sync_cache[sync_key] = {'mtime': pcap_now_mtime,
+                                    'csi_ts_diff_ms': csi_ts_diff}
+            _save_sync(sync_file, sync_cache)
 
-    print("time stamp difference between client and server"
-          "i.e., raspbery Pi vs. workstation")
-    print(csi_ts_diff, 'mili-sec')
-    print(csi_ts_diff/1000./3600., 'hour')
-    print("--------------------------")
+    if verbose:
+        print("time stamp difference between client and server"
+              "i.e., raspbery Pi vs. workstation")
+        print(csi_ts_diff, 'mili-sec')
+        print(np.timedelta64(csi_ts_diff, 'ms') / np.timedelta64(1, 'h'),
+              'hour')
+        print("--------------------------")
 
-    # sync between pcap and cam ts
-    pcap_now_idx = pcap_all.index(pcap_now)
-    pcap_now_ts = int(pcap_now[-18:-5])
-    print(pcap_now_ts)
+        # sync between pcap and cam ts
+        print(pcap_now_ts)
 
     # boundary condition processing
     if pcap_now_idx < pcap_num-1:
-        pcap_next = pcap_all[pcap_now_idx+1]
-        pcap_next_ts = int(pcap_next[-18:-5])
-        print(pcap_next_ts)
+        pcap_next_ts = int(pcap_ts[pcap_now_idx+1])
+        if verbose:
+            print(pcap_next_ts)
     else:
-        pcap_next_ts = pcap_now_ts + 10.*60.*1000.  # assume 10 minutes
+        pcap_next_ts = pcap_now_ts + PCAP_DURATION // np.timedelta64(1, 'ms')
 
-    cam_ts = np.array(cam_ts)
-    cam_pcap_ts_msk = (cam_ts>pcap_now_ts)*(cam_ts<pcap_next_ts)
-    cam_pcap_ts_idx = np.where(cam_pcap_ts_msk)
-
-    cam_pcap_ts = cam_ts[cam_pcap_ts_idx]
-    print(cam_pcap_ts)
+    if cam_sorted:
+        # cam_ts is monotonic, so the matched window is a contiguous slice
+        cam_pcap_ts_lo = np.searchsorted(cam_ts, pcap_now_ts, side='right')
+        cam_pcap_ts_hi = np.searchsorted(cam_ts, pcap_next_ts, side='left')
+        cam_pcap_ts = cam_ts[cam_pcap_ts_lo:cam_pcap_ts_hi]
+    else:
+        cam_pcap_ts_msk = np.logical_and(cam_ts > pcap_now_ts,
+                                         cam_ts < pcap_next_ts)
+        cam_pcap_ts = cam_ts[np.flatnonzero(cam_pcap_ts_msk)]
+    if verbose:
+        print(cam_pcap_ts)
 
     return csi_ts_diff, cam_pcap_ts
 
 
+_worker_syn_args = None
+_worker_cam_ts = None
+_worker_shm = None
+
+
+def _init_worker(syn_args, cam_ts, shm_name=None):
+    """Attach the worker to cam_ts, shared by the parent if shm_name is set
+
+    syn_args are the ``cam_csi_syn`` arguments shared by all pcaps. They are
+    sent once per worker here instead of being pickled with every task.
+    """
+    global _worker_syn_args, _worker_cam_ts, _worker_shm
+    _worker_syn_args = syn_args
+    if shm_name is None:
+        _worker_cam_ts = cam_ts
+    else:
+        shape, dtype = cam_ts
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_cam_ts = np.ndarray(shape, dtype=dtype,
+                                    buffer=_worker_shm.buf)
+        _worker_cam_ts.flags.writeable = False
+
+
+def _syn_worker(pcap_now):
+    cam_list, cam_file, pcap_all, pcap_ts, cam_sorted = _worker_syn_args
+    return cam_csi_syn(cam_list, cam_file, pcap_now, pcap_all, pcap_ts,
+                       cam_ts=_worker_cam_ts, cam_sorted=cam_sorted)
+
+
+def cam_csi_syn_batch(cam_list, cam_file, pcap_all, pcap_ts=None,
+                      max_workers=None):
+    """Run ``cam_csi_syn`` for every pcap in pcap_all with a process pool
+
+    cam_list is parsed, and checked for order, once here. The result is
+    placed in shared memory (Python >= 3.8) and every worker process maps it
+    read-only instead of holding its own copy.
+
+    Args:
+        cam_list: see ``cam_csi_syn``
+        cam_file: see ``cam_csi_syn``
+        pcap_all: all pcap files in the folder, each of them is synced
+        pcap_ts: see ``cam_csi_syn``
+        max_workers: number of worker processes, ``os.cpu_count()`` if None
+
+    Returns: list of ``cam_csi_syn`` results in the order of pcap_all
+    """
+    cam_ts = read_cam_ts(cam_list)
+    if pcap_ts is None:
+        pcap_ts = np.sort(_name_ts(pcap_all))
+    syn_args = (cam_list, cam_file, pcap_all, pcap_ts, is_sorted(cam_ts))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # a few chunks per worker, tasks are only the names of the pcaps
+    chunksize = max(1, len(pcap_all) // (4 * max_workers))
+
+    shm = None
+    initargs = (syn_args, cam_ts)
+    if shared_memory is not None and cam_ts.nbytes > 0:
+        shm = shared_memory.SharedMemory(create=True, size=cam_ts.nbytes)
+        shm_cam_ts = np.ndarray(cam_ts.shape, dtype=cam_ts.dtype,
+                                buffer=shm.buf)
+        shm_cam_ts[:] = cam_ts
+        del shm_cam_ts
+        initargs = (syn_args, (cam_ts.shape, cam_ts.dtype), shm.name)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker,
+                initargs=initargs) as ex:
+            results = list(ex.map(_syn_worker, pcap_all,
+                                  chunksize=chunksize))
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return results
+
+
 if __name__ == '__main__':
     main()
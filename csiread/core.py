@@ -1,8 +1,24 @@
 """A fast channel state information parser for Intel, Atheros and Nexmon."""
 
+import socket
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from . import _csiread
 
 
+def _endian_flag(endian):
+    """Convert ``endian`` to the flag used by ``_csiread``, True for big"""
+    if endian == 'little':
+        return False
+    if endian == 'big':
+        return True
+    raise ValueError("endian must be either 'little' or 'big'")
+
+
 class Intel(_csiread.Intel):
     """Parse CSI obtained using 'Linux 802.11n CSI Tool'.
 
@@ -129,32 +145,93 @@ class Intel(_csiread.Intel):
         """
         super().seek(file, pos, num)
 
+    def seek_batch(self, file, positions, num):
+        """Read packets from several positions with one open file
+
+        It is the same as calling ``seek`` for every position and
+        concatenating the results, but the file is opened only once. On
+        Linux, the next position is read ahead while the current one is
+        parsed, which hides part of the HDD latency.
+
+        Args:
+            file (str): CSI data file.
+            positions (list or ndarray): Positions of file descriptor
+                corresponding to the packets, see ``seek``.
+            num (int): Number of packets to be read from each position.
+                ``len(positions) * num <= bufsize`` must be true, otherwise
+                ``ValueError`` is raised. If ``0``, all packets after each
+                position are read, so ``bufsize`` must hold all of them
+                together.
+
+        Examples:
+
+            >>> csifile = "../material/5300/dataset/sample_0x1_ap.dat"
+            >>> csidata = csiread.Intel(None, bufsize=16)
+            >>> csidata.seek_batch(csifile, [0, 0], 8)
+            >>> print(csidata.csi.shape)
+        """
+        super().seek_batch(file, positions, num)
+
     def pmsg(self, data):
         """Parse message in real time
 
         Args:
-            data (bytes): A bytes object representing the data received by udp
-                socket
+            data (bytes-like): A bytes-like object representing the data
+                received by udp socket, e.g. ``bytes``, ``bytearray`` or
+                ``memoryview``. It is parsed in place without being copied.
         Returns:
             int: The status code. If ``0xbb`` and ``0xc1``, parse message
                 successfully. Otherwise, the ``data`` is not a CSI packet.
 
         Examples:
 
-            >>> import socket
             >>> import csiread
             >>>
             >>> csidata = csiread.Intel(None)
-            >>> with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            >>>     s.bind(('127.0.0.1', 10011))
+            >>> with csiread.make_csi_socket(('127.0.0.1', 10011)) as s:
             >>>     while True:
             >>>         data, address_src = s.recvfrom(4096)
             >>>         code = csidata.pmsg(data)
             >>>         if code == 0xbb:
             >>>             print(csidata.csi.shape)
+
+            Receive into a reusable buffer to avoid allocating a new
+            ``bytes`` object for every packet:
+
+            >>> buf = bytearray(4096)
+            >>> view = memoryview(buf)
+            >>> with csiread.make_csi_socket(('127.0.0.1', 10011)) as s:
+            >>>     while True:
+            >>>         nbytes, address_src = s.recvfrom_into(buf)
+            >>>         code = csidata.pmsg(view[:nbytes])
         """
         return super().pmsg(data)
 
+    def pmsg_many(self, packets):
+        """Parse a batch of messages in one call
+
+        Unlike ``pmsg``, the packets are stored one after another from the
+        beginning of the buffers, and the attributes only cover the parsed
+        packets. Broken beamforming packets are skipped.
+
+        Args:
+            packets (iterable): bytes-like objects received by udp socket,
+                see ``pmsg``.
+
+        Returns:
+            int: The number of ``0xbb`` packets parsed.
+
+        Examples:
+
+            >>> csidata = csiread.Intel(None, bufsize=64)
+            >>> with csiread.make_csi_socket(('127.0.0.1', 10011)) as s:
+            >>>     while True:
+            >>>         packets = [s.recv(4096) for _ in range(64)]
+            >>>         count = csidata.pmsg_many(packets)
+            >>>         print(csidata.csi.shape)
+        """
+        return super().pmsg_many(packets)
+
     def readstp(self, endian='little'):
         """Parse timestamp recorded by the modified ``log_to_file``
 
@@ -174,7 +251,7 @@ class Intel(_csiread.Intel):
             >>> first_stp = csidata.readstp()
             >>> print(first_stp)
         """
-        return super().readstp(endian)
+        return super().readstp(_endian_flag(endian))
 
     def get_total_rss(self):
         """Calculate the Received Signal Strength[RSS] in dBm from CSI
@@ -252,6 +329,36 @@ class Intel(_csiread.Intel):
         """
         return super().apply_sm(scaled_csi)
 
+    def get_link_csi(self, planar=False):
+        """Return CSI in link-major layout
+
+        ``csi`` is stored as Count×30×Nrx×Ntx, so ``csi[:, :, rx, tx]``
+        strides through memory. The returned array is a contiguous
+        Nrx×Ntx×Count×30 copy where ``ret[rx, tx]`` is sequential.
+
+        Args:
+            planar (bool): If True, return the real and imaginary parts as two
+                separate ``np.float32`` arrays instead of one complex array.
+                Default: False
+
+        Returns:
+            ndarray or tuple: Nrx×Ntx×Count×30 CSI, or ``(real, imag)`` if
+                ``planar`` is True.
+
+        Examples:
+
+            >>> csifile = "../material/5300/dataset/sample_0x1_ap.dat"
+            >>> csidata = csiread.Intel(csifile)
+            >>> csidata.read()
+            >>> link_csi = csidata.get_link_csi()
+            >>> print(link_csi[0, 0].shape)
+        """
+        csi = self.csi.transpose(2, 3, 0, 1)
+        if planar:
+            return (np.ascontiguousarray(csi.real, dtype=np.float32),
+                    np.ascontiguousarray(csi.imag, dtype=np.float32))
+        return np.ascontiguousarray(csi)
+
 
 class Atheros(_csiread.Atheros):
     """Parse CSI obtained using 'Atheros CSI Tool'.
@@ -353,7 +460,7 @@ class Atheros(_csiread.Atheros):
             >>> csidata = csiread.Atheros(csifile)
             >>> csidata.read()
         """
-        super().read(endian)
+        super().read(_endian_flag(endian))
 
     def seek(self, file, pos, num, endian='little'):
         """Read packets from a specific position
@@ -381,14 +488,39 @@ class Atheros(_csiread.Atheros):
             >>>     csidata.seek(csifile, 0, i+1)
             >>>     print(csidata.csi.shape)
         """
-        super().seek(file, pos, num, endian)
+        super().seek(file, pos, num, _endian_flag(endian))
+
+    def seek_batch(self, file, positions, num, endian='little'):
+        """Read packets from several positions with one open file
+
+        Args:
+            file (str): CSI data file.
+            positions (list or ndarray): Positions of file descriptor
+                corresponding to the packets, see ``seek``.
+            num (int): Number of packets to be read from each position.
+                ``len(positions) * num <= bufsize`` must be true, otherwise
+                ``ValueError`` is raised. If ``0``, all packets after each
+                position are read, so ``bufsize`` must hold all of them
+                together.
+            endian (str): The byte order of ``file.dat``， it can be ``little``
+                and ``big``. Default: ``little``
+
+        Examples:
+
+            >>> csifile = "../material/atheros/dataset/ath_csi_1.dat"
+            >>> csidata = csiread.Atheros(None, bufsize=16)
+            >>> csidata.seek_batch(csifile, [0, 0], 8)
+            >>> print(csidata.csi.shape)
+        """
+        super().seek_batch(file, positions, num, _endian_flag(endian))
 
     def pmsg(self, data, endian='little'):
         """Parse message in real time
 
         Args:
-            data (bytes): A bytes object representing the data received by udp
-                socket
+            data (bytes-like): A bytes-like object representing the data
+                received by udp socket, e.g. ``bytes``, ``bytearray`` or
+                ``memoryview``. It is parsed in place without being copied.
             endian (str): The byte order of ``file.dat``， it can be ``little``
                 and ``big``. Default: ``little``
 
@@ -398,19 +530,31 @@ class Atheros(_csiread.Atheros):
 
         Examples:
 
-            >>> import socket
             >>> import csiread
             >>>
             >>> csidata = csiread.Atheros(None)
-            >>> with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            >>>     s.bind(('127.0.0.1', 10011))
+            >>> with csiread.make_csi_socket(('127.0.0.1', 10011)) as s:
             >>>     while True:
             >>>         data, address_src = s.recvfrom(4096)
             >>>         code = csidata.pmsg(data)
             >>>         if code == 0xff00:
             >>>             print(csidata.csi.shape)
         """
-        return super().pmsg(data, endian)
+        return super().pmsg(data, _endian_flag(endian))
+
+    def pmsg_many(self, packets, endian='little'):
+        """Parse a batch of messages in one call, see ``Intel.pmsg_many``
+
+        Args:
+            packets (iterable): bytes-like objects received by udp socket,
+                see ``pmsg``.
+            endian (str): The byte order of ``file.dat``， it can be ``little``
+                and ``big``. Default: ``little``
+
+        Returns:
+            int: The number of ``0xff00`` packets parsed.
+        """
+        return super().pmsg_many(packets, _endian_flag(endian))
 
     def readstp(self, endian='little'):
         """Parse timestamp recorded by the modified ``recv_csi``
@@ -428,7 +572,7 @@ class Atheros(_csiread.Atheros):
             >>> first_stp = csidata.readstp()
             >>> print(first_stp)
         """
-        return super().readstp(endian)
+        return super().readstp(_endian_flag(endian))
 
 
 class Nexmon(_csiread.Nexmon):
@@ -536,12 +680,35 @@ class Nexmon(_csiread.Nexmon):
         """
         super().seek(file, pos, num)
 
+    def seek_batch(self, file, positions, num):
+        """Read packets from several positions with one open file
+
+        Args:
+            file (str): CSI data file ``.pcap``.
+            positions (list or ndarray): Positions of file descriptor
+                corresponding to the packets, see ``seek``.
+            num (int): Number of packets to be read from each position.
+                ``len(positions) * num <= bufsize`` must be true, otherwise
+                ``ValueError`` is raised. If ``0``, all packets after each
+                position are read, so ``bufsize`` must hold all of them
+                together.
+
+        Examples:
+
+            >>> csifile = "../material/nexmon/dataset/example.pcap"
+            >>> csidata = csiread.Nexmon(None, chip='4358', bw=80, bufsize=4)
+            >>> csidata.seek_batch(csifile, [24, 24], 2)
+            >>> print(csidata.csi.shape)
+        """
+        super().seek_batch(file, positions, num)
+
     def pmsg(self, data, endian='little'):
         """Parse message in real time
 
         Args:
-            data (bytes): A bytes object representing the data received by raw
-                socket
+            data (bytes-like): A bytes-like object representing the data
+                received by raw socket, e.g. ``bytes``, ``bytearray`` or
+                ``memoryview``. It is parsed in place without being copied.
             endian (str): The byte order of ``file.dat``， it can be ``little``
                 and ``big``. Default: ``little``
 
@@ -551,18 +718,31 @@ class Nexmon(_csiread.Nexmon):
 
         Examples:
 
-            >>> import socket
             >>> import csiread
-            >>> 
+            >>>
             >>> csidata = csiread.Nexmon(None, chip='4358', bw=80)
-            >>> with socket.socket(socket.PF_PACKET, socket.SOCK_RAW, socket.htons(0x3)) as s:
+            >>> with csiread.make_csi_socket() as s:
             >>>     while True:
             >>>         data, address_src = s.recvfrom(4096)
             >>>         code = csidata.pmsg(data)
             >>>         if code == 0xf100:
             >>>             print(csidata.csi.shape)
         """
-        return super().pmsg(data, endian)
+        return super().pmsg(data, _endian_flag(endian))
+
+    def pmsg_many(self, packets, endian='little'):
+        """Parse a batch of messages in one call, see ``Intel.pmsg_many``
+
+        Args:
+            packets (iterable): bytes-like objects received by raw socket,
+                see ``pmsg``.
+            endian (str): The byte order of ``file.dat``， it can be ``little``
+                and ``big``. Default: ``little``
+
+        Returns:
+            int: The number of ``0xf100`` packets parsed.
+        """
+        return super().pmsg_many(packets, _endian_flag(endian))
 
 
 class AtherosPull10(Atheros):
@@ -582,9 +762,7 @@ class AtherosPull10(Atheros):
             >>> csidata = csiread.Atheros(csifile)
             >>> csidata.read()
         """
-        with open(self.file, 'rb') as f:
-            endian = 'big' if f.read(1) == b'\xff' else 'little'
-        self.seek(self.file, 1, 0, endian)
+        self._read_pull10()
 
 
 class NexmonPull46(Nexmon):
@@ -594,10 +772,13 @@ class NexmonPull46(Nexmon):
         See ``Nexmon``
 
     Attributes:
-        rssi (ndarray): rssi
-        fc (ndarray): frame control
+        magic (ndarray): Two magic bytes ``0x1111``, stored as ``np.uint16``
+        rssi (ndarray): rssi, stored as ``np.int8``
+        fc (ndarray): frame control, stored as ``np.uint8``
         others: see ``Nexmon``
 
+        ``magic``, ``rssi`` and ``fc`` are strided views of the same buffer.
+
     References:
         1. `nexmon_csi pull 46 <https://github.com/seemoo-lab/nexmon_csi/pull/46>`_
     """
@@ -606,6 +787,8 @@ class NexmonPull46(Nexmon):
         self.rssi = None
         self.fc = None
         self._autoscale = 0
+        self._pull46_file = None
+        self._pull46_high = None
 
     def __getitem__(self, index):
         ret = super().__getitem__(index)
@@ -615,15 +798,27 @@ class NexmonPull46(Nexmon):
 
     def seek(self, file, pos, num):
         """Read packets from specific position, see ``Nexmon.seek``"""
+        if file != self._pull46_file:
+            self._pull46_file = file
+            self._pull46_high = None
         super().seek(file, pos, num)
         self.__pull46()
 
+    def seek_batch(self, file, positions, num):
+        """Read packets from several positions, see ``Nexmon.seek_batch``"""
+        if file != self._pull46_file:
+            self._pull46_file = file
+            self._pull46_high = None
+        super().seek_batch(file, positions, num)
+        self.__pull46()
+
     def pmsg(self, data, endian='little'):
         """Parse message in real time
 
         Args:
-            data (bytes): A bytes object representing the data received by raw
-                socket
+            data (bytes-like): A bytes-like object representing the data
+                received by raw socket, e.g. ``bytes``, ``bytearray`` or
+                ``memoryview``. It is parsed in place without being copied.
             endian (str): The byte order of ``file.dat``， it can be ``little``
                 and ``big``. Default: ``little``
 
@@ -631,18 +826,138 @@ class NexmonPull46(Nexmon):
             int: The status code. If ``0xf101``, parse message successfully.
                 Otherwise, the ``data`` is not a CSI packet.
         """
-        super().pmsg(data, endian)
+        if super().pmsg(data, endian) is None:
+            # magic is still the split view of the last CSI packet
+            return None
         self.__pull46()
         return 0xf101
 
+    def pmsg_many(self, packets, endian='little'):
+        """Parse a batch of messages in one call, see ``Nexmon.pmsg_many``"""
+        count = super().pmsg_many(packets, endian)
+        self.__pull46()
+        return count
+
     def __pull46(self):
-        if self.magic[0] & 0x0000ffff == 0x1111:
-            self.rssi = ((self.magic & 0x00ff0000) >> 16)
-            self.rssi = self.rssi.astype('i1').astype(int)
-            self.fc = (self.magic & 0xff000000) >> 24
-            self.magic &= 0x0000ffff
+        # the layout never changes within a file or a stream, detect it once
+        if self._pull46_high is None and self.magic.shape[0]:
+            self._pull46_high = bool(self.magic[0] & 0x0000ffff == 0x1111)
+        fields = self.magic.view(_pull46_dtype(self.magic.itemsize,
+                                               bool(self._pull46_high)))
+        self.magic = fields['magic']
+        self.rssi = fields['rssi']
+        self.fc = fields['fc']
+
+
+def _pull46_dtype(itemsize, high):
+    """Structured dtype splitting the magic of nexmon_csi pull 46
+
+    Args:
+        itemsize (int): Size of an integer of ``magic``.
+        high (bool): rssi and fc are in the high 16 bits of magic, which is
+            the case if the low 16 bits of the first magic are ``0x1111``.
+    """
+    if high:
+        bits = {'magic': 0, 'rssi': 16, 'fc': 24}
+    else:
+        bits = {'fc': 0, 'rssi': 8, 'magic': 16}
+    formats = {'magic': '=u2', 'rssi': 'i1', 'fc': 'u1'}
+    offsets = {}
+    for name, bit in bits.items():
+        size = np.dtype(formats[name]).itemsize
+        if sys.byteorder == 'little':
+            offsets[name] = bit // 8
         else:
-            self.rssi = ((self.magic & 0x0000ff00) >> 8)
-            self.rssi = self.rssi.astype('i1').astype(int)
-            self.fc = self.magic & 0x000000ff
-            self.magic = (self.magic & 0xffff0000) >> 16
+            offsets[name] = itemsize - bit // 8 - size
+    return np.dtype({'names': list(formats),
+                     'formats': list(formats.values()),
+                     'offsets': [offsets[name] for name in formats],
+                     'itemsize': itemsize})
+
+
+def make_csi_socket(bind_addr=None, recv_buf=10 * 1024 * 1024):
+    """Create a socket for ``pmsg`` with a large receive buffer
+
+    The default receive buffer of the OS is small enough for packets to be
+    dropped at high CSI rates. ``SO_RCVBUFFORCE`` is tried as well on Linux,
+    which works for root. A warning is issued if the kernel clamps the
+    buffer, e.g. to ``net.core.rmem_max``.
+
+    Args:
+        bind_addr (tuple or None): ``(host, port)`` of the UDP socket used by
+            ``Intel`` and ``Atheros``. If ``None``, a raw ``PF_PACKET``
+            socket receiving all frames is created for ``Nexmon`` (Linux
+            only). Default: None
+        recv_buf (int): The requested receive buffer size in bytes.
+            Default: 10 MiB
+
+    Returns:
+        socket.socket: The socket
+
+    Examples:
+
+        >>> csidata = csiread.Intel(None)
+        >>> with csiread.make_csi_socket(('127.0.0.1', 10011)) as s:
+        >>>     while True:
+        >>>         data, address_src = s.recvfrom(4096)
+        >>>         code = csidata.pmsg(data)
+    """
+    if bind_addr is None:
+        s = socket.socket(socket.PF_PACKET, socket.SOCK_RAW, socket.htons(0x3))
+    else:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buf)
+        if hasattr(socket, 'SO_RCVBUFFORCE'):
+            try:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUFFORCE,
+                             recv_buf)
+            except PermissionError:
+                pass
+        actual = s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if sys.platform.startswith('linux'):
+            # Linux reports twice the size it grants
+            actual //= 2
+        if actual < recv_buf:
+            warnings.warn("receive buffer is %d bytes, less than the "
+                          "requested %d bytes" % (actual, recv_buf),
+                          stacklevel=2)
+        if bind_addr is not None:
+            s.bind(bind_addr)
+    except BaseException:
+        s.close()
+        raise
+    return s
+
+
+def read_many(files, cls=Intel, max_workers=None, **kwargs):
+    """Parse several files in parallel threads
+
+    ``read()`` releases the GIL while parsing, so files are parsed
+    concurrently by a thread pool, one parser per file.
+
+    Args:
+        files (list): Paths of the files.
+        cls (class): Parser class, e.g. ``Intel``, ``Atheros`` or ``Nexmon``.
+            Default: ``Intel``
+        max_workers (int): The maximum number of threads. Default: None
+        **kwargs: Other arguments of ``cls``, e.g. ``chip`` and ``bw`` of
+            ``Nexmon``.
+
+    Returns:
+        list: Parsers that have read ``files``, in the same order.
+
+    Examples:
+
+        >>> csifiles = ["../material/5300/dataset/sample_0x1_ap.dat",
+        >>>             "../material/5300/dataset/sample_0x5_64_3000.dat"]
+        >>> csidatas = csiread.read_many(csifiles, if_report=False)
+        >>> print([csidata.csi.shape for csidata in csidatas])
+    """
+    def read(file):
+        csidata = cls(file, **kwargs)
+        csidata.read()
+        return csidata
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(read, files))
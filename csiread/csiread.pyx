@@ -2,7 +2,8 @@ from libc.stdio cimport (fopen, fread, fclose, fseek, ftell, printf, FILE,
                          SEEK_END, SEEK_SET, SEEK_CUR)
 from libc.stdint cimport (uint16_t, int16_t, uint32_t, int32_t, uint8_t,
                           int8_t, uint64_t)
-from libc.math cimport pi
+from libc.math cimport pi, exp, log, log10
+from libc.string cimport memcpy
 import os
 import struct
 
@@ -10,6 +11,20 @@ import numpy as np
 cimport numpy as np
 cimport cython
 
+cdef extern from *:
+    """
+    #if defined(__linux__)
+    #include <fcntl.h>
+    static void fadvise_willneed(FILE *f, long pos, long len) {
+        posix_fadvise(fileno(f), pos, len, POSIX_FADV_WILLNEED);
+    }
+    #else
+    #define fadvise_willneed(f, pos, len)
+    #endif
+    """
+    # ask the kernel to start reading ahead, it's a no-op off Linux
+    void fadvise_willneed(FILE *f, long pos, long len) nogil
+
 
 cdef class Intel:
     cdef readonly str file
@@ -114,6 +129,13 @@ cdef class Intel:
         self.seek(self.file, 0, 0)
 
     cpdef seek(self, file, long pos, long num):
+        return self.__seek(file, [pos], num)
+
+    cpdef seek_batch(self, file, positions, long num):
+        return self.__seek(file, positions, num)
+
+    cdef __seek(self, file, positions, long num):
+        cdef long pos, start
         cdef FILE *f
 
         tempfile = file.encode(encoding="utf-8")
@@ -127,7 +149,6 @@ cdef class Intel:
 
         fseek(f, 0, SEEK_END)
         cdef long lens = ftell(f)
-        fseek(f, pos, SEEK_SET)
 
         cdef np.uint32_t[:] buf_timestamp_low_mem = self.buf_timestamp_low
         cdef np.int_t[:] buf_bfee_count_mem = self.buf_bfee_count
@@ -155,101 +176,111 @@ cdef class Intel:
         cdef unsigned short field_len
         cdef unsigned char code
         cdef unsigned char buf[1024]
-        cdef unsigned char *payload
         cdef int l
-
-        cdef int index, index_step
-        cdef int i, j, k, g, perm_j
-        cdef uint8_t remainder = 0
-        cdef double a, b
+        cdef int g
 
         if num == 0:
             num = lens
 
-        while pos < (lens-3):
-            l = fread(&buf, sizeof(unsigned char), 3, f)
-            field_len = buf[1] + (buf[0] << 8)
-            code = buf[2]
-
-            if code == 0xbb:
-                l = fread(buf, sizeof(unsigned char), field_len - 1, f)
-                if l != (field_len - 1):
-                    break  # finished
-
-                buf_timestamp_low_mem[count_0xbb] = cu32l(buf[0], buf[1],
-                                                          buf[2], buf[3])
-                buf_bfee_count_mem[count_0xbb] = cu16l(buf[4], buf[5])
-                buf_Nrx_mem[count_0xbb] = buf[8]
-                buf_Ntx_mem[count_0xbb] = buf[9]
-                buf_rssi_a_mem[count_0xbb] = buf[10]
-                buf_rssi_b_mem[count_0xbb] = buf[11]
-                buf_rssi_c_mem[count_0xbb] = buf[12]
-                buf_noise_mem[count_0xbb] = <int8_t>buf[13]
-                buf_agc_mem[count_0xbb] = buf[14]
-                buf_rate_mem[count_0xbb] = cu16l(buf[18], buf[19])
-
-                buf_perm_mem[count_0xbb, 0] = (buf[15] & 0x3)
-                buf_perm_mem[count_0xbb, 1] = ((buf[15] >> 2) & 0x3)
-                buf_perm_mem[count_0xbb, 2] = ((buf[15] >> 4) & 0x3)
-
-                if buf[8] > self.nrxnum:
-                    fclose(f)
-                    raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
-                if buf[9] > self.ntxnum:
-                    fclose(f)
-                    raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
-                if buf[16] | (buf[17] << 8) != 60 * buf[8] * buf[9] + 12:
-                    fclose(f)
-                    raise Exception("Wrong beamforming matrix size"
-                                    ", %dth packet is broken!" % count_0xbb)
-
-                payload = &buf[20]
-                index = 0
-                for i in range(30):
-                    index = index + 3
-                    remainder = index & 0x7
-                    for j in range(buf[8]):
-                        with cython.boundscheck(False):
-                            perm_j = buf_perm_mem[count_0xbb, j]
-                        for k in range(buf[9]):
-                            index_step = index >> 3
-                            a = ccsi(payload[index_step + 0],
-                                     payload[index_step + 1], remainder)
-                            b = ccsi(payload[index_step + 1],
-                                     payload[index_step + 2], remainder)
-
-                            set_csi_mem(buf_csi_mem, count_0xbb, i, perm_j, k,
-                                        a, b)
-                            index += 16
-                count_0xbb += 1
-
-            elif code == 0xc1:
-                l = fread(buf, sizeof(unsigned char), field_len - 1, f)
-                if l != (field_len - 1):
-                    break  # finished
-
-                buf_fc_mem[count_0xc1] = cu16l(buf[0], buf[1])
-                buf_dur_mem[count_0xc1] = cu16l(buf[2], buf[3])
-
-                for g in range(6):
-                    buf_addr_des_mem[count_0xc1, g] = buf[4+g]
-                    buf_addr_src_mem[count_0xc1, g] = buf[10+g]
-                    buf_addr_bssid_mem[count_0xc1, g] = buf[16+g]
-
-                buf_seq_mem[count_0xc1] = cu16l(buf[22], buf[23])
-
-                for g in range(min(self.pl_size, field_len - 1)):
-                    buf_payload_mem[count_0xc1, g] = buf[g]
-
-                count_0xc1 += 1
-
-            else:
-                fseek(f, field_len - 1, SEEK_CUR)
-            pos += (field_len + 2)
-            if count_0xbb >= num:
-                break
+        cdef np.int_t[:] positions_mem = np.asarray(positions,
+                                                   dtype=np.int_)
+        cdef Py_ssize_t p
+        cdef int err = 0
+        cdef int size = len(self.buf_csi)
+        with nogil:
+            for p in range(positions_mem.shape[0]):
+                pos = positions_mem[p]
+                if p + 1 < positions_mem.shape[0]:
+                    fadvise_willneed(f, positions_mem[p + 1], 4096)
+                fseek(f, pos, SEEK_SET)
+                start = count_0xbb
+                while pos < (lens-3):
+                    l = fread(&buf, sizeof(unsigned char), 3, f)
+                    field_len = buf[1] + (buf[0] << 8)
+                    code = buf[2]
+
+                    if code == 0xbb:
+                        l = fread(buf, sizeof(unsigned char), field_len - 1, f)
+                        if l != (field_len - 1):
+                            break  # finished
+                        if count_0xbb == size:
+                            err = 4
+                            break
+
+                        buf_timestamp_low_mem[count_0xbb] = cu32l(
+                            buf[0], buf[1], buf[2], buf[3])
+                        buf_bfee_count_mem[count_0xbb] = cu16l(buf[4], buf[5])
+                        buf_Nrx_mem[count_0xbb] = buf[8]
+                        buf_Ntx_mem[count_0xbb] = buf[9]
+                        buf_rssi_a_mem[count_0xbb] = buf[10]
+                        buf_rssi_b_mem[count_0xbb] = buf[11]
+                        buf_rssi_c_mem[count_0xbb] = buf[12]
+                        buf_noise_mem[count_0xbb] = <int8_t>buf[13]
+                        buf_agc_mem[count_0xbb] = buf[14]
+                        buf_rate_mem[count_0xbb] = cu16l(buf[18], buf[19])
+
+                        buf_perm_mem[count_0xbb, 0] = (buf[15] & 0x3)
+                        buf_perm_mem[count_0xbb, 1] = ((buf[15] >> 2) & 0x3)
+                        buf_perm_mem[count_0xbb, 2] = ((buf[15] >> 4) & 0x3)
+
+                        if buf[8] > self.nrxnum:
+                            err = 1
+                            break
+                        if buf[9] > self.ntxnum:
+                            err = 2
+                            break
+                        if (buf[16] | (buf[17] << 8)
+                                != 60 * buf[8] * buf[9] + 12):
+                            err = 3
+                            break
+
+                        intel_unpack_csi(
+                            &buf[20],
+                            <double *>&buf_csi_mem[count_0xbb, 0, 0, 0],
+                            buf[15], buf[8], buf[9], self.nrxnum, self.ntxnum)
+                        count_0xbb += 1
+
+                    elif code == 0xc1:
+                        l = fread(buf, sizeof(unsigned char), field_len - 1, f)
+                        if l != (field_len - 1):
+                            break  # finished
+                        if count_0xc1 == size:
+                            err = 4
+                            break
+
+                        buf_fc_mem[count_0xc1] = cu16l(buf[0], buf[1])
+                        buf_dur_mem[count_0xc1] = cu16l(buf[2], buf[3])
+
+                        for g in range(6):
+                            buf_addr_des_mem[count_0xc1, g] = buf[4+g]
+                            buf_addr_src_mem[count_0xc1, g] = buf[10+g]
+                            buf_addr_bssid_mem[count_0xc1, g] = buf[16+g]
+
+                        buf_seq_mem[count_0xc1] = cu16l(buf[22], buf[23])
+
+                        for g in range(min(self.pl_size, field_len - 1)):
+                            buf_payload_mem[count_0xc1, g] = buf[g]
+
+                        count_0xc1 += 1
+
+                    else:
+                        fseek(f, field_len - 1, SEEK_CUR)
+                    pos += (field_len + 2)
+                    if count_0xbb - start >= num:
+                        break
+                if err:
+                    break
 
         fclose(f)
+        if err == 1:
+            raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
+        if err == 2:
+            raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
+        if err == 3:
+            raise Exception("Wrong beamforming matrix size, %dth packet is "
+                            "broken!" % count_0xbb)
+        if err == 4:
+            raise ValueError("bufsize=%d is too small!\n" % size)
 
         if self.if_report:
             self.__report(count_0xbb, count_0xc1)
@@ -297,7 +328,19 @@ cdef class Intel:
         self.seq = self.buf_seq[:count_0xc1]
         self.payload = self.buf_payload[:count_0xc1]
 
-    cpdef pmsg(self, unsigned char *data):
+    cpdef pmsg(self, data):
+        return self.__pmsg((data,), False)
+
+    cpdef pmsg_many(self, packets):
+        return self.__pmsg(packets, True)
+
+    cdef __pmsg(self, packets, bint many):
+        """Parse ``packets`` into the buffers
+
+        If ``many``, every CSI packet gets its own row and the attributes are
+        sliced to the parsed packets. Otherwise, ``packets`` holds a single
+        packet parsed into the first row, as ``pmsg`` always did.
+        """
         cdef np.uint32_t[:] buf_timestamp_low_mem = self.buf_timestamp_low
         cdef np.int_t[:] buf_bfee_count_mem = self.buf_bfee_count
         cdef np.int_t[:] buf_Nrx_mem = self.buf_Nrx
@@ -319,73 +362,86 @@ cdef class Intel:
         cdef np.int_t[:] buf_seq_mem = self.buf_seq
         cdef np.uint8_t[:, :] buf_payload_mem = self.buf_payload
 
-        cdef unsigned char code
+        cdef const unsigned char[::1] data
+        cdef unsigned char code = 0
         cdef unsigned char *buf
-        cdef unsigned char *payload
-
-        cdef int index, index_step
-        cdef int i, j, k, g, perm_j
-        cdef uint8_t remainder = 0
-        cdef double a, b
-
-        code = data[0]
-        buf = data
-        buf += 1
-
-        if code == 0xbb:
-            buf_timestamp_low_mem[0] = cu32l(buf[0], buf[1], buf[2], buf[3])
-            buf_bfee_count_mem[0] = cu16l(buf[4], buf[5])
-            buf_Nrx_mem[0] = buf[8]
-            buf_Ntx_mem[0] = buf[9]
-            buf_rssi_a_mem[0] = buf[10]
-            buf_rssi_b_mem[0] = buf[11]
-            buf_rssi_c_mem[0] = buf[12]
-            buf_noise_mem[0] = <int8_t>buf[13]
-            buf_agc_mem[0] = buf[14]
-            buf_rate_mem[0] = cu16l(buf[18], buf[19])
-
-            buf_perm_mem[0, 0] = (buf[15] & 0x3)
-            buf_perm_mem[0, 1] = ((buf[15] >> 2) & 0x3)
-            buf_perm_mem[0, 2] = ((buf[15] >> 4) & 0x3)
-
-            if buf[8] > self.nrxnum:
-                raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
-            if buf[9] > self.ntxnum:
-                raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
-            if buf[16] | (buf[17] << 8) != 60 * buf[8] * buf[9] + 12:
-                printf("Wrong beamforming matrix size, the packet is broken!\n")
-                return code
-
-            payload = &buf[20]
-            index = 0
-            for i in range(30):
-                index = index + 3
-                remainder = index & 0x7
-                for j in range(buf[8]):
-                    with cython.boundscheck(False):
-                        perm_j = buf_perm_mem[0, j]
-                    for k in range(buf[9]):
-                        index_step = index >> 3
-                        a = ccsi(payload[index_step + 0],
-                                 payload[index_step + 1], remainder)
-                        b = ccsi(payload[index_step + 1],
-                                 payload[index_step + 2], remainder)
-
-                        set_csi_mem(buf_csi_mem, 0, i, perm_j, k, a, b)
-                        index += 16
-        if code == 0xc1:
-            buf_fc_mem[0] = cu16l(buf[0], buf[1])
-            buf_dur_mem[0] = cu16l(buf[2], buf[3])
-
-            for g in range(6):
-                buf_addr_des_mem[0, g] = buf[4+g]
-                buf_addr_src_mem[0, g] = buf[10+g]
-                buf_addr_bssid_mem[0, g] = buf[16+g]
-
-            buf_seq_mem[0] = cu16l(buf[22], buf[23])
-
-            for g in range(min(self.pl_size, len(data) - 1)):
-                buf_payload_mem[0, g] = buf[g]
+        cdef int g
+        cdef int count_0xbb = 0
+        cdef int count_0xc1 = 0
+        cdef int size = len(self.buf_csi)
+
+        for packet in packets:
+            data = packet
+            if data.shape[0] == 0:
+                if not many:
+                    return 0
+                continue
+            code = data[0]
+            buf = <unsigned char *>&data[0]
+            buf += 1
+
+            if code == 0xbb:
+                # the 20-byte header and then the beamforming matrix
+                if (data.shape[0] < 21 or
+                        data.shape[0] < 21 + (buf[16] | (buf[17] << 8))):
+                    if not many:
+                        return 0
+                    continue
+                if count_0xbb == size:
+                    raise ValueError("bufsize=%d is too small!\n" % size)
+                buf_timestamp_low_mem[count_0xbb] = cu32l(buf[0], buf[1],
+                                                          buf[2], buf[3])
+                buf_bfee_count_mem[count_0xbb] = cu16l(buf[4], buf[5])
+                buf_Nrx_mem[count_0xbb] = buf[8]
+                buf_Ntx_mem[count_0xbb] = buf[9]
+                buf_rssi_a_mem[count_0xbb] = buf[10]
+                buf_rssi_b_mem[count_0xbb] = buf[11]
+                buf_rssi_c_mem[count_0xbb] = buf[12]
+                buf_noise_mem[count_0xbb] = <int8_t>buf[13]
+                buf_agc_mem[count_0xbb] = buf[14]
+                buf_rate_mem[count_0xbb] = cu16l(buf[18], buf[19])
+
+                buf_perm_mem[count_0xbb, 0] = (buf[15] & 0x3)
+                buf_perm_mem[count_0xbb, 1] = ((buf[15] >> 2) & 0x3)
+                buf_perm_mem[count_0xbb, 2] = ((buf[15] >> 4) & 0x3)
+
+                if buf[8] > self.nrxnum:
+                    raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
+                if buf[9] > self.ntxnum:
+                    raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
+                if buf[16] | (buf[17] << 8) != 60 * buf[8] * buf[9] + 12:
+                    printf("Wrong beamforming matrix size, the packet is "
+                           "broken!\n")
+                    if not many:
+                        return code
+                    continue
+
+                intel_unpack_csi(
+                    &buf[20], <double *>&buf_csi_mem[count_0xbb, 0, 0, 0],
+                    buf[15], buf[8], buf[9], self.nrxnum, self.ntxnum)
+                if many:
+                    count_0xbb += 1
+            if code == 0xc1:
+                if data.shape[0] < 25:
+                    if not many:
+                        return 0
+                    continue
+                if count_0xc1 == size:
+                    raise ValueError("bufsize=%d is too small!\n" % size)
+                buf_fc_mem[count_0xc1] = cu16l(buf[0], buf[1])
+                buf_dur_mem[count_0xc1] = cu16l(buf[2], buf[3])
+
+                for g in range(6):
+                    buf_addr_des_mem[count_0xc1, g] = buf[4+g]
+                    buf_addr_src_mem[count_0xc1, g] = buf[10+g]
+                    buf_addr_bssid_mem[count_0xc1, g] = buf[16+g]
+
+                buf_seq_mem[count_0xc1] = cu16l(buf[22], buf[23])
+
+                for g in range(min(self.pl_size, data.shape[0] - 1)):
+                    buf_payload_mem[count_0xc1, g] = buf[g]
+                if many:
+                    count_0xc1 += 1
 
         del buf_timestamp_low_mem
         del buf_bfee_count_mem
@@ -408,6 +464,31 @@ cdef class Intel:
         del buf_seq_mem
         del buf_payload_mem
 
+        if many:
+            self.count = count_0xbb
+            self.timestamp_low = self.buf_timestamp_low[:count_0xbb]
+            self.bfee_count = self.buf_bfee_count[:count_0xbb]
+            self.Nrx = self.buf_Nrx[:count_0xbb]
+            self.Ntx = self.buf_Ntx[:count_0xbb]
+            self.rssi_a = self.buf_rssi_a[:count_0xbb]
+            self.rssi_b = self.buf_rssi_b[:count_0xbb]
+            self.rssi_c = self.buf_rssi_c[:count_0xbb]
+            self.noise = self.buf_noise[:count_0xbb]
+            self.agc = self.buf_agc[:count_0xbb]
+            self.perm = self.buf_perm[:count_0xbb]
+            self.rate = self.buf_rate[:count_0xbb]
+            self.csi = self.buf_csi[:count_0xbb]
+
+            self.fc = self.buf_fc[:count_0xc1]
+            self.dur = self.buf_dur[:count_0xc1]
+            self.addr_des = self.buf_addr_des[:count_0xc1]
+            self.addr_src = self.buf_addr_src[:count_0xc1]
+            self.addr_bssid = self.buf_addr_bssid[:count_0xc1]
+            self.seq = self.buf_seq[:count_0xc1]
+            self.payload = self.buf_payload[:count_0xc1]
+            return count_0xbb
+
+        # pmsg keeps exposing the whole buffers
         self.timestamp_low = self.buf_timestamp_low
         self.bfee_count = self.buf_bfee_count
         self.Nrx = self.buf_Nrx
@@ -431,19 +512,53 @@ cdef class Intel:
 
         return code
 
-    def readstp(self, endian='little'):
-        self.stp = read_stpfile(self.file + "stp", endian)
+    def readstp(self, bint big_endian=False):
+        self.stp = read_stpfile(self.file + "stp", big_endian)
         return self.stp[0]
 
-    def get_total_rss(self):
-        rssi_mag = np.zeros_like(self.rssi_a, dtype=float)
-        rssi_mag += dbinvs(self.rssi_a)
-        rssi_mag += dbinvs(self.rssi_b)
-        rssi_mag += dbinvs(self.rssi_c)
-        ret = db(rssi_mag) - 44 - self.agc
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cpdef get_total_rss(self):
+        cdef Py_ssize_t i
+        cdef double rssi_mag
+        cdef np.int_t[:] rssi_a_mem = self.rssi_a
+        cdef np.int_t[:] rssi_b_mem = self.rssi_b
+        cdef np.int_t[:] rssi_c_mem = self.rssi_c
+        cdef np.int_t[:] agc_mem = self.agc
+        # rssi_a is the whole buffer after pmsg, not only count packets
+        ret = np.empty(rssi_a_mem.shape[0])
+        cdef np.float64_t[:] ret_mem = ret
+        with nogil:
+            for i in range(rssi_a_mem.shape[0]):
+                rssi_mag = (rssi_dbinv(rssi_a_mem[i]) +
+                            rssi_dbinv(rssi_b_mem[i]) +
+                            rssi_dbinv(rssi_c_mem[i]))
+                ret_mem[i] = 10 * log10(rssi_mag) - 44 - agc_mem[i]
+        del ret_mem
+        del rssi_a_mem
+        del rssi_b_mem
+        del rssi_c_mem
+        del agc_mem
         return ret
 
     cpdef get_scaled_csi(self, inplace=False):
+        temp = self.__scale_factor().reshape(-1, 1, 1, 1)
+
+        if inplace:
+            self.csi *= temp
+            return self.csi
+        else:
+            return self.csi * temp
+
+    def get_scaled_csi_sm(self, inplace=False):
+        # Scaling is folded into the spatial mapping, one pass over csi
+        return self.__remove_sm(self.csi, inplace, self.__scale_factor())
+
+    def apply_sm(self, scaled_csi):
+        return self.__remove_sm(scaled_csi)
+
+    cdef __scale_factor(self):
+        """Per-packet factor converting CSI to channel matrix H"""
         cdef int i, j
         cdef int flat = 30 * self.nrxnum * self.ntxnum
         cdef double constant2 = 2
@@ -483,27 +598,17 @@ cdef class Intel:
                 total_noise_pwr_mem[i] = total_noise_pwr_mem[i] / constant4_5
         del Ntx_mem
         del total_noise_pwr_mem
-        
-        temp = np.sqrt(scale / total_noise_pwr).reshape(-1, 1, 1, 1)
 
-        if inplace:
-            self.csi *= temp
-            return self.csi
-        else:
-            return self.csi * temp
+        return np.sqrt(scale / total_noise_pwr)
 
-    def get_scaled_csi_sm(self, inplace=False):
-        return self.__remove_sm(self.get_scaled_csi(inplace), inplace)
-
-    def apply_sm(self, scaled_csi):
-        return self.__remove_sm(scaled_csi)
-
-    cdef __remove_sm(self, scaled_csi, inplace=False):
+    cdef __remove_sm(self, scaled_csi, inplace=False, factor=None):
         """Actually undo the input spatial mapping
 
         Args:
             scaled_csi (ndarray): Channel matrix H.
             inplace (bool): Optionally do the operation in-place. Default: False
+            factor (ndarray): Optionally scale each packet by ``factor`` in
+                the same pass. Default: None
 
         Returns:
             ndarray: The pure MIMO channel matrix H.
@@ -530,47 +635,53 @@ cdef class Intel:
         if inplace:
             ret = scaled_csi
         else:
+            scaled_csi = np.ascontiguousarray(scaled_csi, dtype=np.complex_)
             ret = np.zeros([self.count, 30, self.nrxnum, self.ntxnum],
                            dtype=np.complex_)
+        if self.count == 0:
+            return ret
+        if factor is None:
+            factor = np.ones(self.count)
 
+        # The kernels work on interleaved real/imag doubles of C-contiguous
+        # arrays, plain arithmetic that compilers can vectorize.
         cdef int i, N, M, B
+        cdef int nrx = self.nrxnum, ntx = self.ntxnum
+        cdef Py_ssize_t step = 2 * 30 * nrx * ntx
+        cdef double k
+        cdef np.float64_t[:] factor_mem = factor
         cdef np.int_t[:] Ntx_mem = self.Ntx
         cdef np.int_t[:] Nrx_mem = self.Nrx
         cdef np.int_t[:] rate_mem = self.rate
-        cdef np.complex128_t[:, :, :, :] scaled_csi_mem = scaled_csi
-        cdef np.complex128_t[:, :, :, :] ret_mem = ret
-        cdef np.complex128_t[:, :] sm_2_20_mem = sm_2_20
-        cdef np.complex128_t[:, :] sm_2_40_mem = sm_2_40
-        cdef np.complex128_t[:, :] sm_3_20_mem = sm_3_20
-        cdef np.complex128_t[:, :] sm_3_40_mem = sm_3_40
+        cdef double[::1] scaled_csi_mem = (scaled_csi.reshape(-1)
+                                           .view(np.float_))
+        cdef double[::1] ret_mem = ret.reshape(-1).view(np.float_)
+        cdef double[::1] sm_2_20_mem = sm_2_20.reshape(-1).view(np.float_)
+        cdef double[::1] sm_2_40_mem = sm_2_40.reshape(-1).view(np.float_)
+        cdef double[::1] sm_3_20_mem = sm_3_20.reshape(-1).view(np.float_)
+        cdef double[::1] sm_3_40_mem = sm_3_40.reshape(-1).view(np.float_)
+        cdef double *src = &scaled_csi_mem[0]
+        cdef double *dst = &ret_mem[0]
 
         for i in range(self.count):
             M = Ntx_mem[i]
             N = Nrx_mem[i]
             B = (rate_mem[i] & 0x800) == 0x800
-            if B:
-                if M == 3:
-                    intel_mm_o3(ret_mem[i], scaled_csi_mem[i], sm_3_40_mem,
-                                N, M)
-                elif M == 2:
-                    intel_mm_o3(ret_mem[i], scaled_csi_mem[i], sm_2_40_mem,
-                                N, M)
-                else:
-                    if inplace is False:
-                        ret_mem[i] = scaled_csi_mem[i]
+            k = factor_mem[i]
+            if M == 3:
+                intel_mm_o3(dst + i * step, src + i * step,
+                            &sm_3_40_mem[0] if B else &sm_3_20_mem[0],
+                            N, M, nrx, ntx, k)
+            elif M == 2:
+                intel_mm_o3(dst + i * step, src + i * step,
+                            &sm_2_40_mem[0] if B else &sm_2_20_mem[0],
+                            N, M, nrx, ntx, k)
             else:
-                if M == 3:
-                    intel_mm_o3(ret_mem[i], scaled_csi_mem[i], sm_3_20_mem,
-                                N, M)
-                elif M == 2:
-                    intel_mm_o3(ret_mem[i], scaled_csi_mem[i], sm_2_20_mem,
-                                N, M)
-                else:
-                    if inplace is False:
-                        ret_mem[i] = scaled_csi_mem[i]
+                intel_scale(dst + i * step, src + i * step, step, k)
         del Ntx_mem
         del Nrx_mem
         del rate_mem
+        del factor_mem
         del scaled_csi_mem
         del ret_mem
         del sm_2_20_mem
@@ -686,10 +797,24 @@ cdef class Atheros:
                  if_report=True, bufsize=0):
         pass
 
-    cpdef read(self, endian='little'):
-        self.seek(self.file, 0, 0, endian)
+    cpdef read(self, bint big_endian=False):
+        self.__seek(self.file, [0], 0, big_endian)
+
+    cpdef seek(self, file, long pos, long num, bint big_endian=False):
+        return self.__seek(file, [pos], num, big_endian)
+
+    cpdef seek_batch(self, file, positions, long num,
+                     bint big_endian=False):
+        return self.__seek(file, positions, num, big_endian)
 
-    cpdef seek(self, file, long pos, long num, endian='little'):
+    def _read_pull10(self):
+        # pull 10 writes a byte-order marker at offset 0; probe it on the
+        # same FILE* instead of opening the file twice.
+        self.__seek(self.file, [1], 0, False, True)
+
+    cdef __seek(self, file, positions, long num, bint big_endian,
+                bint probe=False):
+        cdef long pos, start
         cdef FILE *f
 
         tempfile = file.encode(encoding="utf-8")
@@ -703,7 +828,6 @@ cdef class Atheros:
 
         fseek(f, 0, SEEK_END)
         cdef long lens = ftell(f)
-        fseek(f, pos, SEEK_SET)
 
         cdef np.uint64_t[:] buf_timestamp_mem = self.buf_timestamp
         cdef np.int_t[:] buf_csi_len_mem = self.buf_csi_len
@@ -726,9 +850,10 @@ cdef class Atheros:
         cdef int count = 0
         cdef int c_len, pl_len, pl_stop
         cdef int l, field_len
-        cdef uint16_t (*ath_cu16)(uint8_t, uint8_t)
+        cdef uint16_t (*ath_cu16)(uint8_t, uint8_t) nogil
         cdef uint64_t (*ath_cu64)(uint64_t, uint64_t, uint64_t, uint64_t,
-                                  uint64_t, uint64_t, uint64_t, uint64_t)
+                                  uint64_t, uint64_t, uint64_t,
+                                  uint64_t) nogil
 
         if num == 0:
             num = lens
@@ -737,113 +862,138 @@ cdef class Atheros:
         cdef int k, nc_idx, nr_idx, imag, real, i
         cdef unsigned char buf[4096]
         cdef unsigned char csi_buf[4096]
-        if endian == "little":
-            ath_cu16 = cu16l
-            ath_cu64 = cu64l
-        elif endian == "big":
+        if probe:
+            fseek(f, 0, SEEK_SET)
+            big_endian = fread(&buf, sizeof(unsigned char), 1, f) == 1 \
+                and buf[0] == 0xff
+        if big_endian:
             ath_cu16 = cu16b
             ath_cu64 = cu64b
         else:
-            fclose(f)
-            raise ValueError("endian must be either 'little' or 'big'")
-
-        while pos < (lens - 4):
-            l = fread(&buf, sizeof(unsigned char), 2, f)
-            field_len = ath_cu16(buf[0], buf[1])
-            pos += 2
-            if (pos + field_len) > lens:
-                break
-
-            l = fread(&buf, sizeof(unsigned char), 25, f)
-            buf_timestamp_mem[count] = ath_cu64(buf[0], buf[1], buf[2], buf[3],
-                                                buf[4], buf[5], buf[6], buf[7])
-            buf_csi_len_mem[count] = ath_cu16(buf[8], buf[9])
-            buf_tx_channel_mem[count] = ath_cu16(buf[10], buf[11])
-            buf_payload_len_mem[count] = ath_cu16(buf[23], buf[24])
-            buf_err_info_mem[count] = buf[12]
-            buf_noise_floor_mem[count] = buf[13]
-            buf_Rate_mem[count] = buf[14]
-            buf_bandWidth_mem[count] = buf[15]
-            buf_num_tones_mem[count] = buf[16]
-            buf_nr_mem[count] = buf[17]
-            buf_nc_mem[count] = buf[18]
-            buf_rssi_mem[count] = buf[19]
-            buf_rssi_1_mem[count] = buf[20]
-            buf_rssi_2_mem[count] = buf[21]
-            buf_rssi_3_mem[count] = buf[22]
-            pos += 25
-
-            if buf[17] > self.nrxnum:
-                fclose(f)
-                raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
-            if buf[18] > self.ntxnum:
-                fclose(f)
-                raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
-
-            c_len = buf_csi_len_mem[count]
-            if c_len > 0:
-                l = fread(&csi_buf, sizeof(unsigned char), c_len, f)
-                bits_left = 16
-                bitmask = (1 << 10) - 1
-
-                idx = 0
-                h_data = csi_buf[idx]
-                idx += 1
-                h_data += (csi_buf[idx] << 8)
-                idx += 1
-                current_data = h_data & ((1 << 16) - 1)
-
-                for k in range(buf[16]):
-                    for nr_idx in range(buf[17]):
-                        for nc_idx in range(buf[18]):
-                            # imag
-                            if (bits_left - 10) < 0:
-                                h_data = csi_buf[idx]
-                                idx += 1
-                                h_data += (csi_buf[idx] << 8)
-                                idx += 1
-                                current_data += h_data << bits_left
-                                bits_left += 16
-                            imag = current_data & bitmask
-                            if imag & (1 << 9):
-                                imag -= (1 << 10)
-
-                            bits_left -= 10
-                            current_data = current_data >> 10
-                            # real
-                            if (bits_left - 10) < 0:
-                                h_data = csi_buf[idx]
-                                idx += 1
-                                h_data += (csi_buf[idx] << 8)
-                                idx += 1
-                                current_data += h_data << bits_left
-                                bits_left += 16
-                            real = current_data & bitmask
-                            if real & (1 << 9):
-                                real -= (1 << 10)
-
-                            bits_left -= 10
-                            current_data = current_data >> 10
-                            # csi
-                            set_csi_mem(buf_csi_mem, count, k, nr_idx, nc_idx,
-                                        real, imag)
-                pos += c_len
-
-            pl_len = buf_payload_len_mem[count]
-            pl_stop = min(pl_len, self.pl_size)
-            if pl_len > 0:
-                l = fread(&buf, sizeof(unsigned char), pl_len, f)
-                for i in range(pl_stop):
-                    buf_payload_mem[count, i] = buf[i]
-                pos += pl_len
+            ath_cu16 = cu16l
+            ath_cu64 = cu64l
 
-            # In matlab, read_log_file drops the last two packets, but here we 
-            # keep them.
-            count += 1
-            if count >= num:
-                break
+        cdef np.int_t[:] positions_mem = np.asarray(positions,
+                                                   dtype=np.int_)
+        cdef Py_ssize_t p
+        cdef int err = 0
+        cdef int size = len(self.buf_csi)
+        with nogil:
+            for p in range(positions_mem.shape[0]):
+                pos = positions_mem[p]
+                if p + 1 < positions_mem.shape[0]:
+                    fadvise_willneed(f, positions_mem[p + 1], 4096)
+                fseek(f, pos, SEEK_SET)
+                start = count
+                while pos < (lens - 4):
+                    l = fread(&buf, sizeof(unsigned char), 2, f)
+                    field_len = ath_cu16(buf[0], buf[1])
+                    pos += 2
+                    if (pos + field_len) > lens:
+                        break
+                    if count == size:
+                        err = 3
+                        break
+
+                    l = fread(&buf, sizeof(unsigned char), 25, f)
+                    buf_timestamp_mem[count] = ath_cu64(buf[0], buf[1], buf[2],
+                                                        buf[3], buf[4], buf[5],
+                                                        buf[6], buf[7])
+                    buf_csi_len_mem[count] = ath_cu16(buf[8], buf[9])
+                    buf_tx_channel_mem[count] = ath_cu16(buf[10], buf[11])
+                    buf_payload_len_mem[count] = ath_cu16(buf[23], buf[24])
+                    buf_err_info_mem[count] = buf[12]
+                    buf_noise_floor_mem[count] = buf[13]
+                    buf_Rate_mem[count] = buf[14]
+                    buf_bandWidth_mem[count] = buf[15]
+                    buf_num_tones_mem[count] = buf[16]
+                    buf_nr_mem[count] = buf[17]
+                    buf_nc_mem[count] = buf[18]
+                    buf_rssi_mem[count] = buf[19]
+                    buf_rssi_1_mem[count] = buf[20]
+                    buf_rssi_2_mem[count] = buf[21]
+                    buf_rssi_3_mem[count] = buf[22]
+                    pos += 25
+
+                    if buf[17] > self.nrxnum:
+                        err = 1
+                        break
+                    if buf[18] > self.ntxnum:
+                        err = 2
+                        break
+
+                    c_len = buf_csi_len_mem[count]
+                    if c_len > 0:
+                        l = fread(&csi_buf, sizeof(unsigned char), c_len, f)
+                        bits_left = 16
+                        bitmask = (1 << 10) - 1
+
+                        idx = 0
+                        h_data = csi_buf[idx]
+                        idx += 1
+                        h_data += (csi_buf[idx] << 8)
+                        idx += 1
+                        current_data = h_data & ((1 << 16) - 1)
+
+                        for k in range(buf[16]):
+                            for nr_idx in range(buf[17]):
+                                for nc_idx in range(buf[18]):
+                                    # imag
+                                    if (bits_left - 10) < 0:
+                                        h_data = csi_buf[idx]
+                                        idx += 1
+                                        h_data += (csi_buf[idx] << 8)
+                                        idx += 1
+                                        current_data += h_data << bits_left
+                                        bits_left += 16
+                                    imag = current_data & bitmask
+                                    if imag & (1 << 9):
+                                        imag -= (1 << 10)
+
+                                    bits_left -= 10
+                                    current_data = current_data >> 10
+                                    # real
+                                    if (bits_left - 10) < 0:
+                                        h_data = csi_buf[idx]
+                                        idx += 1
+                                        h_data += (csi_buf[idx] << 8)
+                                        idx += 1
+                                        current_data += h_data << bits_left
+                                        bits_left += 16
+                                    real = current_data & bitmask
+                                    if real & (1 << 9):
+                                        real -= (1 << 10)
+
+                                    bits_left -= 10
+                                    current_data = current_data >> 10
+                                    # csi
+                                    set_csi_mem(buf_csi_mem, count, k, nr_idx,
+                                                nc_idx, real, imag)
+                        pos += c_len
+
+                    pl_len = buf_payload_len_mem[count]
+                    pl_stop = min(pl_len, self.pl_size)
+                    if pl_len > 0:
+                        l = fread(&buf, sizeof(unsigned char), pl_len, f)
+                        for i in range(pl_stop):
+                            buf_payload_mem[count, i] = buf[i]
+                        pos += pl_len
+
+                    # In matlab, read_log_file drops the last two packets,
+                    # but here we keep them.
+                    count += 1
+                    if count - start >= num:
+                        break
+                if err:
+                    break
 
         fclose(f)
+        if err == 1:
+            raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
+        if err == 2:
+            raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
+        if err == 3:
+            raise ValueError("bufsize=%d is too small!\n" % size)
 
         if self.if_report:
             self.__report(count)
@@ -885,7 +1035,14 @@ cdef class Atheros:
         self.payload = self.buf_payload[:count]
         self.count = count
 
-    cpdef pmsg(self, unsigned char *data, endian='little'):
+    cpdef pmsg(self, data, bint big_endian=False):
+        return self.__pmsg((data,), False, big_endian)
+
+    cpdef pmsg_many(self, packets, bint big_endian=False):
+        return self.__pmsg(packets, True, big_endian)
+
+    cdef __pmsg(self, packets, bint many, bint big_endian):
+        """Parse ``packets`` into the buffers, see ``Intel.__pmsg``"""
         cdef np.uint64_t[:] buf_timestamp_mem = self.buf_timestamp
         cdef np.int_t[:] buf_csi_len_mem = self.buf_csi_len
         cdef np.int_t[:] buf_tx_channel_mem = self.buf_tx_channel
@@ -904,7 +1061,9 @@ cdef class Atheros:
         cdef np.complex128_t[:, :, :, :] buf_csi_mem = self.buf_csi
         cdef np.uint8_t[:, :] buf_payload_mem = self.buf_payload
 
+        cdef const unsigned char[::1] data
         cdef int count = 0
+        cdef int size = len(self.buf_csi)
         cdef int c_len, pl_len, pl_stop
 
         cdef int bits_left, bitmask, idx, h_data, current_data
@@ -915,90 +1074,105 @@ cdef class Atheros:
         cdef uint64_t (*ath_cu64)(uint64_t, uint64_t, uint64_t, uint64_t,
                                   uint64_t, uint64_t, uint64_t, uint64_t)
 
-        buf = data
-        if endian == "little":
-            ath_cu16 = cu16l
-            ath_cu64 = cu64l
-        elif endian == "big":
+        if big_endian:
             ath_cu16 = cu16b
             ath_cu64 = cu64b
         else:
-            raise ValueError("endian must be either 'little' or 'big'")
-        buf_timestamp_mem[count] = ath_cu64(buf[0], buf[1], buf[2], buf[3],
-                                            buf[4], buf[5], buf[6], buf[7])
-        buf_csi_len_mem[count] = ath_cu16(buf[8], buf[9])
-        buf_tx_channel_mem[count] = ath_cu16(buf[10], buf[11])
-        buf_payload_len_mem[count] = ath_cu16(buf[23], buf[24])
-        buf_err_info_mem[count] = buf[12]
-        buf_noise_floor_mem[count] = buf[13]
-        buf_Rate_mem[count] = buf[14]
-        buf_bandWidth_mem[count] = buf[15]
-        buf_num_tones_mem[count] = buf[16]
-        buf_nr_mem[count] = buf[17]
-        buf_nc_mem[count] = buf[18]
-        buf_rssi_mem[count] = buf[19]
-        buf_rssi_1_mem[count] = buf[20]
-        buf_rssi_2_mem[count] = buf[21]
-        buf_rssi_3_mem[count] = buf[22]
-
-        if buf[17] > self.nrxnum:
-            raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
-        if buf[18] > self.ntxnum:
-            raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
+            ath_cu16 = cu16l
+            ath_cu64 = cu64l
+        for packet in packets:
+            data = packet
+            # the 25-byte header and then csi_len and payload_len bytes
+            if data.shape[0] < 25:
+                if not many:
+                    return
+                continue
+            buf = <unsigned char *>&data[0]
+            c_len = ath_cu16(buf[8], buf[9])
+            pl_stop = min(ath_cu16(buf[23], buf[24]), self.pl_size)
+            if data.shape[0] < 25 + c_len + pl_stop:
+                if not many:
+                    return
+                continue
+            if count == size:
+                raise ValueError("bufsize=%d is too small!\n" % size)
+            buf_timestamp_mem[count] = ath_cu64(buf[0], buf[1], buf[2], buf[3],
+                                                buf[4], buf[5], buf[6], buf[7])
+            buf_csi_len_mem[count] = ath_cu16(buf[8], buf[9])
+            buf_tx_channel_mem[count] = ath_cu16(buf[10], buf[11])
+            buf_payload_len_mem[count] = ath_cu16(buf[23], buf[24])
+            buf_err_info_mem[count] = buf[12]
+            buf_noise_floor_mem[count] = buf[13]
+            buf_Rate_mem[count] = buf[14]
+            buf_bandWidth_mem[count] = buf[15]
+            buf_num_tones_mem[count] = buf[16]
+            buf_nr_mem[count] = buf[17]
+            buf_nc_mem[count] = buf[18]
+            buf_rssi_mem[count] = buf[19]
+            buf_rssi_1_mem[count] = buf[20]
+            buf_rssi_2_mem[count] = buf[21]
+            buf_rssi_3_mem[count] = buf[22]
+
+            if buf[17] > self.nrxnum:
+                raise ValueError("nrxnum=%d is too small!\n" % self.nrxnum)
+            if buf[18] > self.ntxnum:
+                raise ValueError("ntxnum=%d is too small!\n" % self.ntxnum)
+
+            c_len = buf_csi_len_mem[count]
+            if c_len > 0:
+                csi_buf = &buf[25]
+                bits_left = 16
+                bitmask = (1 << 10) - 1
+
+                idx = 0
+                h_data = csi_buf[idx]
+                idx += 1
+                h_data += (csi_buf[idx] << 8)
+                idx += 1
+                current_data = h_data & ((1 << 16) - 1)
+
+                for k in range(buf[16]):
+                    for nr_idx in range(buf[17]):
+                        for nc_idx in range(buf[18]):
+                            # imag
+                            if (bits_left - 10) < 0:
+                                h_data = csi_buf[idx]
+                                idx += 1
+                                h_data += (csi_buf[idx] << 8)
+                                idx += 1
+                                current_data += h_data << bits_left
+                                bits_left += 16
+                            imag = current_data & bitmask
+                            if imag & (1 << 9):
+                                imag -= (1 << 10)
+
+                            bits_left -= 10
+                            current_data = current_data >> 10
+                            # real
+                            if (bits_left - 10) < 0:
+                                h_data = csi_buf[idx]
+                                idx += 1
+                                h_data += (csi_buf[idx] << 8)
+                                idx += 1
+                                current_data += h_data << bits_left
+                                bits_left += 16
+                            real = current_data & bitmask
+                            if real & (1 << 9):
+                                real -= (1 << 10)
 
-        c_len = buf_csi_len_mem[count]
-        if c_len > 0:
-            csi_buf = &buf[25]
-            bits_left = 16
-            bitmask = (1 << 10) - 1
-
-            idx = 0
-            h_data = csi_buf[idx]
-            idx += 1
-            h_data += (csi_buf[idx] << 8)
-            idx += 1
-            current_data = h_data & ((1 << 16) - 1)
-
-            for k in range(buf[16]):
-                for nr_idx in range(buf[17]):
-                    for nc_idx in range(buf[18]):
-                        # imag
-                        if (bits_left - 10) < 0:
-                            h_data = csi_buf[idx]
-                            idx += 1
-                            h_data += (csi_buf[idx] << 8)
-                            idx += 1
-                            current_data += h_data << bits_left
-                            bits_left += 16
-                        imag = current_data & bitmask
-                        if imag & (1 << 9):
-                            imag -= (1 << 10)
-
-                        bits_left -= 10
-                        current_data = current_data >> 10
-                        # real
-                        if (bits_left - 10) < 0:
-                            h_data = csi_buf[idx]
-                            idx += 1
-                            h_data += (csi_buf[idx] << 8)
-                            idx += 1
-                            current_data += h_data << bits_left
-                            bits_left += 16
-                        real = current_data & bitmask
-                        if real & (1 << 9):
-                            real -= (1 << 10)
-
-                        bits_left -= 10
-                        current_data = current_data >> 10
-                        # csi
-                        set_csi_mem(buf_csi_mem, count, k, nr_idx, nc_idx,
-                                    real, imag)
-
-        pl_len = buf_payload_len_mem[count]
-        pl_stop = min(pl_len, self.pl_size)
-        if pl_len > 0:
-            for i in range(pl_stop):
-                buf_payload_mem[count, i] = buf[25+c_len+i]
+                            bits_left -= 10
+                            current_data = current_data >> 10
+                            # csi
+                            set_csi_mem(buf_csi_mem, count, k, nr_idx, nc_idx,
+                                        real, imag)
+
+            pl_len = buf_payload_len_mem[count]
+            pl_stop = min(pl_len, self.pl_size)
+            if pl_len > 0:
+                for i in range(pl_stop):
+                    buf_payload_mem[count, i] = buf[25+c_len+i]
+            if many:
+                count += 1
 
         del buf_timestamp_mem
         del buf_csi_len_mem
@@ -1018,6 +1192,28 @@ cdef class Atheros:
         del buf_csi_mem
         del buf_payload_mem
 
+        if many:
+            self.count = count
+            self.timestamp = self.buf_timestamp[:count]
+            self.csi_len = self.buf_csi_len[:count]
+            self.tx_channel = self.buf_tx_channel[:count]
+            self.err_info = self.buf_err_info[:count]
+            self.noise_floor = self.buf_noise_floor[:count]
+            self.Rate = self.buf_Rate[:count]
+            self.bandWidth = self.buf_bandWidth[:count]
+            self.num_tones = self.buf_num_tones[:count]
+            self.nr = self.buf_nr[:count]
+            self.nc = self.buf_nc[:count]
+            self.rssi = self.buf_rssi[:count]
+            self.rssi_1 = self.buf_rssi_1[:count]
+            self.rssi_2 = self.buf_rssi_2[:count]
+            self.rssi_3 = self.buf_rssi_3[:count]
+            self.payload_len = self.buf_payload_len[:count]
+            self.csi = self.buf_csi[:count]
+            self.payload = self.buf_payload[:count]
+            return count
+
+        # pmsg keeps exposing the whole buffers
         self.timestamp = self.buf_timestamp
         self.csi_len = self.buf_csi_len
         self.tx_channel = self.buf_tx_channel
@@ -1038,8 +1234,8 @@ cdef class Atheros:
 
         return 0xff00
 
-    def readstp(self, endian='little'):
-        self.stp = read_stpfile(self.file + "stp", endian)
+    def readstp(self, bint big_endian=False):
+        self.stp = read_stpfile(self.file + "stp", big_endian)
         return self.stp[0]
 
     def __report(self, int count):
@@ -1122,6 +1318,13 @@ cdef class Nexmon:
         self.seek(self.file, 24, 0)
 
     cpdef seek(self, file, long pos, long num):
+        return self.__seek(file, [pos], num)
+
+    cpdef seek_batch(self, file, positions, long num):
+        return self.__seek(file, positions, num)
+
+    cdef __seek(self, file, positions, long num):
+        cdef long pos, start
         cdef FILE *f
 
         tempfile = file.encode(encoding="utf-8")
@@ -1136,7 +1339,6 @@ cdef class Nexmon:
         endian = self.__pcapheader(f)
         fseek(f, 0, SEEK_END)
         cdef long lens = ftell(f)
-        fseek(f, pos, SEEK_SET)
 
         cdef np.uint32_t[:] buf_sec_mem = self.buf_sec
         cdef np.uint32_t[:] buf_usec_mem = self.buf_usec
@@ -1155,10 +1357,10 @@ cdef class Nexmon:
         cdef unsigned char buf[4096]
         cdef int l, i
         cdef int nfft = <int>(self.bw * 3.2)
-        cdef uint32_t caplen
+        cdef uint32_t caplen, sec, usec, wirelen
         cdef bint flag
-        cdef uint16_t (*nex_cu16)(uint8_t, uint8_t) 
-        cdef uint32_t (*nex_cu32)(uint8_t, uint8_t, uint8_t, uint8_t)
+        cdef uint16_t (*nex_cu16)(uint8_t, uint8_t) nogil
+        cdef uint32_t (*nex_cu32)(uint8_t, uint8_t, uint8_t, uint8_t) nogil
 
         if num == 0:
             num = lens
@@ -1172,53 +1374,79 @@ cdef class Nexmon:
             nex_cu32 = cu32b
             flag = False
 
-        while pos < (lens - 24):
-            # global header
-            l = fread(&buf, sizeof(unsigned char), 16, f)
-            if l < 16:
-                break
-            caplen = nex_cu32(buf[8], buf[9], buf[10], buf[11])
-            buf_sec_mem[count] = nex_cu32(buf[0], buf[1], buf[2], buf[3])
-            buf_usec_mem[count] = nex_cu32(buf[4], buf[5], buf[6], buf[7])
-            buf_caplen_mem[count] = caplen
-            buf_wirelen_mem[count] = nex_cu32(buf[12], buf[13], buf[14],
-                                              buf[15])
-            pos += (16 + caplen)
-
-            # we don't care about enth+ip+udp header
-            l = fread(&buf, sizeof(unsigned char), 42, f)
-            if buf[6:12] != b'NEXMON':
-                fseek(f, caplen - 42, SEEK_CUR)
-                continue
-
-            # nexmon header
-            l = fread(&buf, sizeof(unsigned char), 18, f)
-            buf_magic_mem[count] = nex_cu32(buf[0], buf[1], buf[2], buf[3])
-            for i in range(6):
-                buf_src_addr_mem[count, i] = buf[4+i]
-            buf_seq_mem[count] = nex_cu16(buf[10], buf[11])
-            buf_core_mem[count] = nex_cu16(buf[12], buf[13]) & 0x7
-            buf_spatial_mem[count] = (nex_cu16(buf[12], buf[13]) >> 3) & 0x7
-            buf_chan_spec_mem[count] = nex_cu16(buf[14], buf[15])
-            buf_chip_version_mem[count] = nex_cu16(buf[16], buf[17])
-
-            # CSI
-            l = fread(&buf, sizeof(unsigned char), caplen - 42 - 18, f)
-            if self.chip == '4339' or self.chip == '43455c0':
-                unpack_int16(buf, buf_csi_mem[count], nfft, flag)
-            elif self.chip == '4358':
-                unpack_float(buf, buf_csi_mem[count], nfft, 9, 5,
-                             self._autoscale, flag)
-            elif self.chip == '4366c0':
-                unpack_float(buf, buf_csi_mem[count], nfft, 12, 6,
-                             self._autoscale, flag)
-            else:
-                pass
-
-            count += 1
-            if count >= num:
-                break
+        # self.chip is a str, map it to a code the nogil loop can test
+        cdef int chip = {'4339': 1, '43455c0': 1, '4358': 2,
+                         '4366c0': 3}.get(self.chip, 0)
+        cdef np.int_t[:] positions_mem = np.asarray(positions,
+                                                   dtype=np.int_)
+        cdef Py_ssize_t p
+        cdef int err = 0
+        cdef int size = len(self.buf_csi)
+        with nogil:
+            for p in range(positions_mem.shape[0]):
+                pos = positions_mem[p]
+                if p + 1 < positions_mem.shape[0]:
+                    fadvise_willneed(f, positions_mem[p + 1], 4096)
+                fseek(f, pos, SEEK_SET)
+                start = count
+                while pos < (lens - 24):
+                    # global header
+                    l = fread(&buf, sizeof(unsigned char), 16, f)
+                    if l < 16:
+                        break
+                    sec = nex_cu32(buf[0], buf[1], buf[2], buf[3])
+                    usec = nex_cu32(buf[4], buf[5], buf[6], buf[7])
+                    caplen = nex_cu32(buf[8], buf[9], buf[10], buf[11])
+                    wirelen = nex_cu32(buf[12], buf[13], buf[14], buf[15])
+                    pos += (16 + caplen)
+
+                    # we don't care about enth+ip+udp header
+                    l = fread(&buf, sizeof(unsigned char), 42, f)
+                    if not is_nexmon(&buf[6]):
+                        fseek(f, caplen - 42, SEEK_CUR)
+                        continue
+                    if count == size:
+                        err = 1
+                        break
+                    buf_sec_mem[count] = sec
+                    buf_usec_mem[count] = usec
+                    buf_caplen_mem[count] = caplen
+                    buf_wirelen_mem[count] = wirelen
+
+                    # nexmon header
+                    l = fread(&buf, sizeof(unsigned char), 18, f)
+                    buf_magic_mem[count] = nex_cu32(buf[0], buf[1], buf[2],
+                                                    buf[3])
+                    for i in range(6):
+                        buf_src_addr_mem[count, i] = buf[4+i]
+                    buf_seq_mem[count] = nex_cu16(buf[10], buf[11])
+                    buf_core_mem[count] = nex_cu16(buf[12], buf[13]) & 0x7
+                    buf_spatial_mem[count] = ((nex_cu16(buf[12], buf[13]) >> 3)
+                                              & 0x7)
+                    buf_chan_spec_mem[count] = nex_cu16(buf[14], buf[15])
+                    buf_chip_version_mem[count] = nex_cu16(buf[16], buf[17])
+
+                    # CSI
+                    l = fread(&buf, sizeof(unsigned char), caplen - 42 - 18, f)
+                    if chip == 1:
+                        unpack_int16(buf, buf_csi_mem[count], nfft, flag)
+                    elif chip == 2:
+                        unpack_float(buf, buf_csi_mem[count], nfft, 9, 5,
+                                     self._autoscale, flag)
+                    elif chip == 3:
+                        unpack_float(buf, buf_csi_mem[count], nfft, 12, 6,
+                                     self._autoscale, flag)
+                    else:
+                        pass
+
+                    count += 1
+                    if count - start >= num:
+                        break
+                if err:
+                    break
         fclose(f)
+        if err == 1:
+            raise ValueError("bufsize=%d is too small!\n" % size)
         self.count = count
         if self.if_report:
             printf("%d packets parsed\n", count)
@@ -1248,7 +1476,14 @@ cdef class Nexmon:
         self.chip_version = self.buf_chip_version[:count]
         self.csi = self.buf_csi[:count]
 
-    cpdef pmsg(self, unsigned char *data, endian='little'):
+    cpdef pmsg(self, data, bint big_endian=False):
+        return self.__pmsg((data,), False, big_endian)
+
+    cpdef pmsg_many(self, packets, bint big_endian=False):
+        return self.__pmsg(packets, True, big_endian)
+
+    cdef __pmsg(self, packets, bint many, bint big_endian):
+        """Parse ``packets`` into the buffers, see ``Intel.__pmsg``"""
         cdef np.int_t[:] buf_magic_mem = self.buf_magic
         cdef np.int_t[:, :] buf_src_addr_mem = self.buf_src_addr
         cdef np.int_t[:] buf_seq_mem = self.buf_seq
@@ -1258,50 +1493,67 @@ cdef class Nexmon:
         cdef np.int_t[:] buf_chip_version_mem = self.buf_chip_version
         cdef np.complex128_t[:, :] buf_csi_mem = self.buf_csi
 
+        cdef const unsigned char[::1] data
         cdef int count = 0
+        cdef int size = len(self.buf_csi)
         cdef unsigned char *buf
         cdef int l, i
         cdef int nfft = <int>(self.bw * 3.2)
+        # headers end at 60, then 4 bytes per subcarrier
+        cdef int csi_stop = 60 + 4 * nfft
+        cdef int chip = {'4339': 1, '43455c0': 1, '4358': 2,
+                         '4366c0': 3}.get(self.chip, 0)
         cdef bint flag
-        cdef uint16_t (*nex_cu16)(uint8_t, uint8_t) 
+        cdef uint16_t (*nex_cu16)(uint8_t, uint8_t)
         cdef uint32_t (*nex_cu32)(uint8_t, uint8_t, uint8_t, uint8_t)
 
-        buf = data
-
-        if endian == "little":
-            nex_cu16 = cu16l
-            nex_cu32 = cu32l
-            flag = True
-        else:
+        if big_endian:
             nex_cu16 = cu16b
             nex_cu32 = cu32b
             flag = False
-
-        # we don't care about enth+ip+udp header
-        if buf[6:12] != b'NEXMON':
-            return
-
-        # nexmon header
-        buf_magic_mem[count] = nex_cu32(buf[42], buf[43], buf[44], buf[45])
-        for i in range(6):
-            buf_src_addr_mem[count, i] = buf[46+i]
-        buf_seq_mem[count] = nex_cu16(buf[52], buf[53])
-        buf_core_mem[count] = nex_cu16(buf[54], buf[55]) & 0x7
-        buf_spatial_mem[count] = (nex_cu16(buf[54], buf[55]) >> 3) & 0x7
-        buf_chan_spec_mem[count] = nex_cu16(buf[56], buf[57])
-        buf_chip_version_mem[count] = nex_cu16(buf[58], buf[59])
-
-        # CSI
-        if self.chip == '4339' or self.chip == '43455c0':
-            unpack_int16(&buf[60], buf_csi_mem[count], nfft, flag)
-        elif self.chip == '4358':
-            unpack_float(&buf[60], buf_csi_mem[count], nfft, 9, 5,
-                         self._autoscale, flag)
-        elif self.chip == '4366c0':
-            unpack_float(&buf[60], buf_csi_mem[count], nfft, 12, 6,
-                         self._autoscale, flag)
         else:
-            pass
+            nex_cu16 = cu16l
+            nex_cu32 = cu32l
+            flag = True
+
+        for packet in packets:
+            data = packet
+            if data.shape[0] < csi_stop:
+                if not many:
+                    return
+                continue
+            buf = <unsigned char *>&data[0]
+            # we don't care about enth+ip+udp header
+            if not is_nexmon(&buf[6]):
+                if not many:
+                    return
+                continue
+            if count == size:
+                raise ValueError("bufsize=%d is too small!\n" % size)
+
+            # nexmon header
+            buf_magic_mem[count] = nex_cu32(buf[42], buf[43], buf[44], buf[45])
+            for i in range(6):
+                buf_src_addr_mem[count, i] = buf[46+i]
+            buf_seq_mem[count] = nex_cu16(buf[52], buf[53])
+            buf_core_mem[count] = nex_cu16(buf[54], buf[55]) & 0x7
+            buf_spatial_mem[count] = (nex_cu16(buf[54], buf[55]) >> 3) & 0x7
+            buf_chan_spec_mem[count] = nex_cu16(buf[56], buf[57])
+            buf_chip_version_mem[count] = nex_cu16(buf[58], buf[59])
+
+            # CSI
+            if chip == 1:
+                unpack_int16(&buf[60], buf_csi_mem[count], nfft, flag)
+            elif chip == 2:
+                unpack_float(&buf[60], buf_csi_mem[count], nfft, 9, 5,
+                             self._autoscale, flag)
+            elif chip == 3:
+                unpack_float(&buf[60], buf_csi_mem[count], nfft, 12, 6,
+                             self._autoscale, flag)
+            else:
+                pass
+            if many:
+                count += 1
 
         del buf_magic_mem
         del buf_src_addr_mem
@@ -1312,6 +1564,19 @@ cdef class Nexmon:
         del buf_chip_version_mem
         del buf_csi_mem
 
+        if many:
+            self.count = count
+            self.magic = self.buf_magic[:count]
+            self.src_addr = self.buf_src_addr[:count]
+            self.seq = self.buf_seq[:count]
+            self.core = self.buf_core[:count]
+            self.spatial = self.buf_spatial[:count]
+            self.chan_spec = self.buf_chan_spec[:count]
+            self.chip_version = self.buf_chip_version[:count]
+            self.csi = self.buf_csi[:count]
+            return count
+
+        # pmsg keeps exposing the whole buffers
         self.magic = self.buf_magic
         self.src_addr = self.buf_src_addr
         self.seq = self.buf_seq
@@ -1352,7 +1617,7 @@ cdef class Nexmon:
             l = fread(&buf, sizeof(unsigned char), 16+42, f)
             if l < 16:
                 break
-            if buf[22:28] == b'NEXMON':
+            if is_nexmon(&buf[22]):
                 count += 1
             caplen = nex_cu32(buf[8], buf[9], buf[10], buf[11])
             fseek(f, caplen - 42, SEEK_CUR)
@@ -1384,61 +1649,121 @@ cdef class Nexmon:
         return endian
 
 
-@cython.boundscheck(False)
-@cython.wraparound(False)
-cdef void intel_mm_o3(np.complex128_t[:, :, :] ret_mem,
-                      np.complex128_t[:, :, :] scaled_csi_mem,
-                      np.complex128_t[:, :] sm, int N, int M):
+cdef void intel_mm_o3(double *ret, const double *csi, const double *sm,
+                      int N, int M, int nrx, int ntx, double k) nogil:
     """Matrix multiplication of O^3
-    
+
     The function uses a trick of GEMM. It can be faster by using OPENMP and
-    BLAS, but needs more dependencies.
+    BLAS, but needs more dependencies. ``sm`` is multiplied by ``k`` first,
+    which scales the result at the cost of M*M multiplications. All arrays
+    hold interleaved real and imaginary parts, ``ret`` may be ``csi``. In
+    that case the entries outside the N x M block are scaled by ``k`` too,
+    as if the whole ``csi`` was scaled before the spatial mapping.
     """
-    cdef int i, j
-    cdef np.complex128_t sm00, sm01, sm02, sm10, sm11, sm12, sm20, sm21, sm22
-    cdef np.complex128_t r0, r1, r2
-
-    if M == 2:
-        sm00 = sm[0, 0]
-        sm01 = sm[0, 1]
-        sm10 = sm[1, 0]
-        sm11 = sm[1, 1]
-        for i in range(30):
-            for j in range(N):
-                r0 = scaled_csi_mem[i, j, 0]
-                r1 = scaled_csi_mem[i, j, 1]
-                ret_mem[i, j, 0] = r0 * sm00 + r1 * sm10
-                ret_mem[i, j, 1] = r0 * sm01 + r1 * sm11
-    if M == 3:
-        sm00 = sm[0, 0]
-        sm01 = sm[0, 1]
-        sm02 = sm[0, 2]
-        sm10 = sm[1, 0]
-        sm11 = sm[1, 1]
-        sm12 = sm[1, 2]
-        sm20 = sm[2, 0]
-        sm21 = sm[2, 1]
-        sm22 = sm[2, 2]
-        for i in range(30):
-            for j in range(N):
-                r0 = scaled_csi_mem[i, j, 0]
-                r1 = scaled_csi_mem[i, j, 1]
-                r2 = scaled_csi_mem[i, j, 2]
-                ret_mem[i, j, 0] = r0 * sm00 + r1 * sm10 + r2 * sm20
-                ret_mem[i, j, 1] = r0 * sm01 + r1 * sm11 + r2 * sm21
-                ret_mem[i, j, 2] = r0 * sm02 + r1 * sm12 + r2 * sm22
+    cdef int i, j, t, u
+    cdef Py_ssize_t off
+    cdef bint inplace = <const double *>ret == csi
+    cdef double smr[3][3]
+    cdef double smi[3][3]
+    cdef double rr[3]
+    cdef double ri[3]
+    cdef double re, im
+
+    for u in range(M):
+        for t in range(M):
+            smr[u][t] = sm[2 * (u * M + t)] * k
+            smi[u][t] = sm[2 * (u * M + t) + 1] * k
+    for i in range(30):
+        for j in range(N):
+            off = 2 * ntx * (i * nrx + j)
+            for u in range(M):
+                rr[u] = csi[off + 2 * u]
+                ri[u] = csi[off + 2 * u + 1]
+            for t in range(M):
+                re = 0
+                im = 0
+                for u in range(M):
+                    re += rr[u] * smr[u][t] - ri[u] * smi[u][t]
+                    im += rr[u] * smi[u][t] + ri[u] * smr[u][t]
+                ret[off + 2 * t] = re
+                ret[off + 2 * t + 1] = im
+            if inplace:
+                for t in range(2 * M, 2 * ntx):
+                    ret[off + t] *= k
+        if inplace:
+            for off in range(2 * ntx * (i * nrx + N), 2 * ntx * (i + 1) * nrx):
+                ret[off] *= k
+
+
+cdef void intel_scale(double *ret, const double *csi, Py_ssize_t n,
+                      double k) nogil:
+    """ret = csi * k over ``n`` doubles, ``ret`` may be ``csi``"""
+    cdef Py_ssize_t i
+    for i in range(n):
+        ret[i] = csi[i] * k
+
+
+cdef inline void intel_unpack(uint8_t *payload, double *csi, uint8_t perm,
+                              int nrx, int ntx, int nrxnum,
+                              int ntxnum) nogil:
+    """Unpack the 30×nrx×ntx CSI of a 0xbb packet
+
+    ``csi`` is the C-contiguous 30×nrxnum×ntxnum complex block of the packet
+    and ``perm`` is the antenna permutation byte.
+    """
+    cdef int i, j, k, index_step
+    cdef int index = 0
+    cdef uint8_t remainder
+    cdef double *p
+
+    for i in range(30):
+        index = index + 3
+        remainder = index & 0x7
+        for j in range(nrx):
+            p = csi + 2 * ntxnum * (i * nrxnum + ((perm >> (2 * j)) & 0x3))
+            for k in range(ntx):
+                index_step = index >> 3
+                p[2 * k] = ccsi(payload[index_step + 0],
+                                payload[index_step + 1], remainder)
+                p[2 * k + 1] = ccsi(payload[index_step + 1],
+                                    payload[index_step + 2], remainder)
+                index += 16
+
+
+cdef void intel_unpack_csi(uint8_t *payload, double *csi, uint8_t perm,
+                           int nrx, int ntx, int nrxnum, int ntxnum) nogil:
+    """Dispatch ``intel_unpack`` on the antenna setting of the packet
+
+    Each branch inlines ``intel_unpack`` with constant ``nrx`` and ``ntx``,
+    so the compiler unrolls the loops for the common settings.
+    """
+    if nrx == 3 and ntx == 1:
+        intel_unpack(payload, csi, perm, 3, 1, nrxnum, ntxnum)
+    elif nrx == 3 and ntx == 2:
+        intel_unpack(payload, csi, perm, 3, 2, nrxnum, ntxnum)
+    elif nrx == 3 and ntx == 3:
+        intel_unpack(payload, csi, perm, 3, 3, nrxnum, ntxnum)
+    elif nrx == 2 and ntx == 1:
+        intel_unpack(payload, csi, perm, 2, 1, nrxnum, ntxnum)
+    elif nrx == 2 and ntx == 2:
+        intel_unpack(payload, csi, perm, 2, 2, nrxnum, ntxnum)
+    elif nrx == 1 and ntx == 1:
+        intel_unpack(payload, csi, perm, 1, 1, nrxnum, ntxnum)
+    else:
+        intel_unpack(payload, csi, perm, nrx, ntx, nrxnum, ntxnum)
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cdef inline void set_csi_mem(np.complex128_t[:, :, :, :] csi_mem, int count,
-                             int s, int r, int t, double real, double imag):
+                             int s, int r, int t, double real,
+                             double imag) nogil:
     csi_mem[count, s, r, t].real = real
     csi_mem[count, s, r, t].imag = imag
 
 
 cdef void unpack_int16(uint8_t *buf, np.complex128_t[:] csi_mem, int nfft,
-                       bint flag):
+                       bint flag) nogil:
     cdef int i, j
     if flag:
         for i in range(nfft):
@@ -1453,7 +1778,7 @@ cdef void unpack_int16(uint8_t *buf, np.complex128_t[:] csi_mem, int nfft,
 
 
 cdef void unpack_float(uint8_t *buf, np.complex128_t[:] csi_mem, int nfft,
-                       int M, int E, int autoscale, bint flag):
+                       int M, int E, int autoscale, bint flag) nogil:
     """N = M * R ^ E
 
     M: Mantissa
@@ -1550,42 +1875,60 @@ cdef void unpack_float(uint8_t *buf, np.complex128_t[:] csi_mem, int nfft,
         csi_mem[i].imag = <double>v_imag
 
 
-cdef inline int8_t ccsi(uint8_t a, uint8_t b, uint8_t remainder):
+# b"NEXMON" as a 4-byte and a 2-byte word in native byte order
+cdef uint32_t NEXMON_W4
+cdef uint16_t NEXMON_W2
+memcpy(&NEXMON_W4, <const char *>b"NEXMON", 4)
+memcpy(&NEXMON_W2, <const char *>b"NEXMON" + 4, 2)
+
+
+cdef inline bint is_nexmon(const uint8_t *p) nogil:
+    """Whether ``p`` starts with b"NEXMON", compared word-wise"""
+    cdef uint32_t w4
+    cdef uint16_t w2
+    memcpy(&w4, p, 4)
+    memcpy(&w2, p + 4, 2)
+    return ((w4 ^ NEXMON_W4) | (w2 ^ NEXMON_W2)) == 0
+
+
+cdef inline int8_t ccsi(uint8_t a, uint8_t b, uint8_t remainder) nogil:
     return ((a >> remainder) | (b << (8 - remainder))) & 0xff
 
 
-cdef inline uint32_t cu32l(uint8_t a, uint8_t b, uint8_t c, uint8_t d):
+cdef inline uint32_t cu32l(uint8_t a, uint8_t b, uint8_t c, uint8_t d) nogil:
     return a | (b << 8) | (c << 16) | (d << 24)
 
 
-cdef inline uint32_t cu32b(uint8_t a, uint8_t b, uint8_t c, uint8_t d):
+cdef inline uint32_t cu32b(uint8_t a, uint8_t b, uint8_t c, uint8_t d) nogil:
     return d | (c << 8) | (b << 16) | (a << 24)
 
 
-cdef inline uint16_t cu16l(uint8_t a, uint8_t b):
+cdef inline uint16_t cu16l(uint8_t a, uint8_t b) nogil:
     return a | (b << 8)
 
 
-cdef inline uint16_t cu16b(uint8_t a, uint8_t b):
+cdef inline uint16_t cu16b(uint8_t a, uint8_t b) nogil:
     return b | (a << 8)
 
 
 cdef inline uint64_t cu64l(uint64_t a, uint64_t b, uint64_t c, uint64_t d,
-                           uint64_t e, uint64_t f, uint64_t g, uint64_t h):
+                           uint64_t e, uint64_t f, uint64_t g,
+                           uint64_t h) nogil:
     return (a | (b << 8) | (c << 16) | (d << 24) |
             (e << 32) | (f << 40) | (g << 48) | (h << 56))
 
 
 cdef inline uint64_t cu64b(uint64_t a, uint64_t b, uint64_t c, uint64_t d,
-                           uint64_t e, uint64_t f, uint64_t g, uint64_t h):
+                           uint64_t e, uint64_t f, uint64_t g,
+                           uint64_t h) nogil:
     return (h | (g << 8) | (f << 16) | (e << 24) |
             (d << 32) | (c << 40) | (b << 48) | (a << 56))
 
 
-cdef read_stpfile(stpfile, endian):
+cdef read_stpfile(stpfile, bint big_endian):
     lens = os.path.getsize(stpfile) // 8
     stp = np.empty(lens)
-    format_string = '<LL' if endian == 'little' else '>LL'
+    format_string = '>LL' if big_endian else '<LL'
     cdef int i, a, b
     f = open(stpfile, "rb")
     for i in range(lens):
@@ -1595,15 +1938,19 @@ cdef read_stpfile(stpfile, endian):
     return stp
 
 
-cdef db(x):
-    return 10 * np.log10(x)
-
-
 cdef dbinv(x):
     return np.power(10, x / 10)
 
 
-cdef dbinvs(x):
-    ret = np.power(10, x / 10)
-    ret[ret == 1] = 0
-    return ret
+# RSSI is reported as a uint8, tabulate its dbinv. 0 means no antenna.
+cdef double RSSI_DBINV[256]
+RSSI_DBINV[0] = 0
+for _i in range(1, 256):
+    RSSI_DBINV[_i] = 10 ** (_i / 10)
+
+
+cdef inline double rssi_dbinv(np.int_t x) nogil:
+    if 0 <= x < 256:
+        return RSSI_DBINV[x]
+    return exp(x * log(10) / 10)
+
@@ -74,3 +74,60 @@ def calib(phase, bw=20, ng=2, axis=1):
 
     phase_calib = p - a * s - b
     return phase_calib
+
+
+def quantize(csi):
+    """Quantize CSI to int16 real and imaginary planes
+
+    Each packet is scaled independently so that its largest component maps
+    to 32767. The result takes a quarter of the memory of ``np.complex_``.
+
+    Args:
+        csi (ndarray): CSI, the first dimension is packet.
+
+    Returns:
+        tuple: ``(real, imag, scale)``, ``real`` and ``imag`` are ``np.int16``
+            arrays with the same shape as ``csi``, ``scale`` is a
+            ``np.float32`` array with the shape ``(Count,)``.
+
+    Examples:
+
+        >>> real, imag, scale = quantize(csidata.csi)
+        >>> csi = dequantize(real, imag, scale)
+    """
+    csi = np.asarray(csi)
+    shape = (-1,) + (1,) * (csi.ndim - 1)
+    peak = np.maximum(np.abs(csi.real), np.abs(csi.imag))
+    # an explicit width keeps the reshape valid when there are no packets
+    width = int(np.prod(csi.shape[1:]))
+    peak = peak.reshape(csi.shape[0], width).max(axis=1, initial=0)
+    scale = (peak / 32767).astype(np.float32)
+    scale[scale == 0] = 1
+    s = scale.reshape(shape)
+    real = np.rint(csi.real / s).astype(np.int16)
+    imag = np.rint(csi.imag / s).astype(np.int16)
+    return real, imag, scale
+
+
+def dequantize(real, imag, scale, dtype=np.complex64):
+    """Restore CSI quantized by ``quantize``
+
+    Args:
+        real (ndarray): Real part, ``np.int16``.
+        imag (ndarray): Imaginary part, ``np.int16``.
+        scale (ndarray): Scale of each packet.
+        dtype (dtype): Complex dtype of the result. Default: ``np.complex64``
+
+    Returns:
+        ndarray: CSI
+
+    Examples:
+
+        >>> real, imag, scale = quantize(csidata.csi)
+        >>> csi = dequantize(real, imag, scale)
+    """
+    s = np.asarray(scale).reshape((-1,) + (1,) * (np.ndim(real) - 1))
+    csi = np.empty(np.shape(real), dtype=dtype)
+    np.multiply(real, s, out=csi.real, casting='unsafe')
+    np.multiply(imag, s, out=csi.imag, casting='unsafe')
+    return csi